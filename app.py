@@ -498,8 +498,7 @@
 #         q = request.form.get("q", "").strip()
 #         company = request.form.get("company", "").strip()
 #         if q and company:
-#             recommendations = run_pipeline(q, company)
-#             hits = get_last_hits()
+#             recommendations, hits = run_pipeline(q, company)
 #     return render_template_string(HTML, hits=hits, recs=recommendations, q=q)
 
 # if __name__ == "__main__":
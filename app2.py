@@ -1,18 +1,40 @@
 #app2.py
-import os, json, re, requests
+import os, json, re, uuid, time, sqlite3, threading, requests, tempfile, contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from flask import Flask, request, render_template_string, redirect, url_for, session
+from flask import Flask, request, render_template_string, redirect, url_for, session, jsonify, Response, stream_with_context
 from bs4 import BeautifulSoup
-from crewai import Agent, Task, Crew, LLM
+from crewai import Agent, LLM
 from linkedin_search_mcp import linkedin_contact_lookup
+from provider_router import QuotaExceededError
+from entity_classifier import classify_locally, remember_label, normalize_label
+from batch_lookup import iter_batch, load_queries, BATCH_WORKERS, BATCH_RATE_PER_SEC, BATCH_MAX_WORKERS, BATCH_MAX_RATE_PER_SEC
 from sharepoint_kb import get_sharepoint_kb, init_db, get_kb_from_db, update_kb_in_db
-from salesforce_mcp import fetch_salesforce_data
+from sharepoint_kb import get_active_kb, get_active_kb_version, list_kb_versions, activate_kb_version
+from sharepoint_kb import get_kb_version, previous_kb_version
+from salesforce_mcp import get_salesforce_insights, prefetch_salesforce_snapshot, mcp_pool
+from salesforce_cache import invalidate as invalidate_salesforce_cache
+from crew_pool import CrewPool
+from llm_cache import init_llm_cache, cached_completion, fingerprint
+from metrics import span, render_prometheus, register_collector, set_gauge, describe
+from linkedin_search_mcp import router as search_router
+from token_usage import init_usage_db, usage_scope, usage_report, PromptBudgetExceeded
+from prompt_budget import build_focused_prompt
+from kb_digest import init_digest_db, ensure_digest, stored_digest, build_digest_once, KB_DIGEST_ENABLED
 from ui_template import HTML
 
 load_dotenv()
 
 # Initialize the database cache on startup
 init_db()
+init_llm_cache()
+init_usage_db()
+init_digest_db()
+
+# Bring the Salesforce MCP server up once per worker instead of once per question
+if os.getenv("SALESFORCE_MCP_EAGER_START", "true").lower() in ("1", "true", "yes"):
+    mcp_pool.start_async()
 
 # --- LLM & Agent Configurations ---
 llm = LLM(model="gemini/gemini-2.0-flash", api_key=os.getenv("GEMINI_API_KEY"))
@@ -74,6 +96,14 @@ sharepoint_kb_agent = Agent(
     verbose=True
 )
 
+# Pre-built crews per agent; each request only supplies its prompt
+identifier_pool = CrewPool(identifier, expected_output="Return only the classification.")
+focused_analyst_pool = CrewPool(focused_analyst_agent, expected_output="A concise summary of 3-7 lines.")
+sharepoint_kb_pool = CrewPool(
+    sharepoint_kb_agent,
+    expected_output="A 2–4 sentence professional alignment summary. The output must not contain any conversational filler and should start directly with the analysis."
+)
+
 # --- Knowledge Base ---
 KB_URLS = [ "https://www.intelliswift.com/services/icaf-test-automation-framework",
             "https://www.intelliswift.com/services/digital-product-engineering",
@@ -92,13 +122,95 @@ def scrape_kb():
     return kb
 kb_context = scrape_kb()
 
+# KB fingerprints are part of the LLM cache key, so a KB refresh invalidates cached answers
+kb_version = fingerprint(kb_context)
+
+def load_kb_digest(sharepoint_content: str, build: bool = True):
+    """
+    Service catalog digest of both KBs for the guided-step prompts (built once per KB version).
+    build=False never calls the LLM: boot and hot reloads use the digest stored by /update_kb, the
+    rollback or a background build, else the extractive one.
+    """
+    if not KB_DIGEST_ENABLED:
+        return kb_context, kb_version
+    try:
+        if not build:
+            return stored_digest(kb_context, sharepoint_content)
+        return ensure_digest(llm, kb_context, sharepoint_content)
+    except Exception as e:
+        print(f"[WARN] KB digest unavailable, prompts will use the raw KB: {e}")
+        return kb_context, kb_version
+
+def start_kb_digest_build(sharepoint_content: str):
+    """
+    Builds the LLM digest for this KB version in a background thread (one worker
+    at a time, see build_digest_once); refresh_kb switches to it once stored.
+    """
+    if KB_DIGEST_ENABLED:
+        threading.Thread(target=build_digest_once, args=(llm, kb_context, sharepoint_content),
+                         name="kb-digest", daemon=True).start()
+
+def build_kb_snapshot(version, sharepoint_content: str, build_digest: bool = True) -> dict:
+    """Everything derived from one SharePoint KB version. Requests read a snapshot; reloads swap in a new one."""
+    digest, digest_version = load_kb_digest(sharepoint_content, build=build_digest)
+    return {"version": version, "sharepoint": sharepoint_content, "sharepoint_version": fingerprint(sharepoint_content),
+            "digest": digest, "digest_version": digest_version}
+
+# Another worker's /update_kb (or a rollback) changes the active version in SQLite; each
+# worker checks it at most every KB_VERSION_CHECK_SECONDS and reloads only when it moved.
+KB_VERSION_CHECK_SECONDS = float(os.getenv("KB_VERSION_CHECK_SECONDS", "2"))
+_active_kb = get_active_kb()
+# Workers boot on the stored (or extractive) digest; a missing LLM digest is built in the background
+kb_snapshot = build_kb_snapshot(
+    _active_kb["version"] if _active_kb and _active_kb["content"] == sharepoint_kb_context else None,
+    sharepoint_kb_context, build_digest=False)
+if kb_snapshot["digest_version"].endswith("-extractive"):
+    start_kb_digest_build(sharepoint_kb_context)
+_kb_lock = threading.Lock()
+_kb_checked_at = time.monotonic()
+
+def refresh_kb(force: bool = False) -> dict:
+    """Swaps in the active KB version if it differs from this worker's snapshot."""
+    global kb_snapshot, _kb_checked_at
+    if not force and time.monotonic() - _kb_checked_at < KB_VERSION_CHECK_SECONDS:
+        return kb_snapshot
+    # Only one thread checks/reloads; the others keep serving the current snapshot meanwhile
+    if not _kb_lock.acquire(blocking=force):
+        return kb_snapshot
+    try:
+        _kb_checked_at = time.monotonic()
+        if get_active_kb_version() not in (None, kb_snapshot["version"]):
+            active = get_active_kb()
+            if active:
+                kb_snapshot = build_kb_snapshot(active["version"], active["content"], build_digest=False)
+                print(f"✅ Hot-reloaded SharePoint KB version {active['version']}.")
+                if kb_snapshot["digest_version"].endswith("-extractive"):
+                    print("[WARN] No stored KB digest for this version; using the extractive digest until one is built.")
+                    start_kb_digest_build(active["content"])
+        elif kb_snapshot["digest_version"].endswith("-extractive"):
+            # Serving the fallback digest: switch as soon as the real one has been stored
+            digest, digest_version = load_kb_digest(kb_snapshot["sharepoint"], build=False)
+            if not digest_version.endswith("-extractive"):
+                kb_snapshot = dict(kb_snapshot, digest=digest, digest_version=digest_version)
+    except sqlite3.Error as e:
+        print(f"[WARN] KB version check failed: {e}")
+    finally:
+        _kb_lock.release()
+    return kb_snapshot
+
 # --- Core Task Logic ---
+# Background pool for LLM calls that can overlap with the request's own work
+search_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_EXECUTOR_WORKERS", "8")))
+
 def classify_entity(q: str):
-    task = Task(
-        description=f"Classify '{q}' as: 'person', 'company', or 'person + company'",
-        expected_output="Return only the classification.",
-        agent=identifier)
-    return Crew(agents=[identifier], tasks=[task], process="sequential").kickoff().raw.strip().lower()
+    # Clear cases (known companies, "name at company", plain names, past labels) skip the LLM
+    label = classify_locally(q)
+    if label:
+        print(f"[INFO] Classified '{q}' locally as: {label}")
+        return label
+    raw = identifier_pool.run(f"Classify '{q}' as: 'person', 'company', or 'person + company'").lower()
+    remember_label(q, raw)
+    return normalize_label(raw) or raw
 
 def get_focused_answer(context: str, question_key: str):
     prompts = {
@@ -107,13 +219,15 @@ def get_focused_answer(context: str, question_key: str):
         "final_summary": "Provide an elaborate and detailed summary (15-20 lines) of everything we know about this prospect. Synthesize all available information from their profile (role, company, detailed skills) and explicitly connect it to specific Intelliswift services from the knowledge base. Explain the strategic value and why they are a strong prospect for our company."
     }
     question = prompts.get(question_key, "Provide a general overview.")
-    final_prompt = f"""CONTEXT: {context}\n\nKNOWLEDGE BASE: {kb_context}\n\nQUESTION: {question}\n\nTASK: Answer the question as a concise summary in 3-7 lines. Focus only on the information available. Do not mention what is missing. Do not use lists or bullet points."""
-    task = Task(
-        description=final_prompt, expected_output="A concise summary of 3-7 lines.",
-        agent=focused_analyst_agent)
-    return Crew(agents=[focused_analyst_agent], tasks=[task], process="sequential").kickoff().raw.strip()
+    # Deduplicated profile plus the most relevant KB sections, within this step's token budget
+    snapshot = kb_snapshot
+    final_prompt = build_focused_prompt(context, question, question_key, snapshot["digest"])
+    return cached_completion(
+        f"focused:{question_key}", llm.model, final_prompt,
+        lambda: focused_analyst_pool.run(final_prompt), kb_version=snapshot["digest_version"])
 
 def get_sharepoint_answer(question: str):
+    snapshot = kb_snapshot
     prompt = f"""
         You are a SharePoint knowledge analyst. Your task is to evaluate how a candidate's skills align with our internal SharePoint documentation.
 
@@ -124,7 +238,7 @@ def get_sharepoint_answer(question: str):
 
         **SharePoint Knowledge Base Summary:**
         ---
-        {sharepoint_kb_context}
+        {snapshot["sharepoint"]}
         ---
 
         **Instructions:**
@@ -141,17 +255,9 @@ def get_sharepoint_answer(question: str):
         - Begin your response directly with the analysis of the candidate. For example: "The candidate's profile demonstrates experience in..."
         """.strip()
 
-    task = Task(
-        description=prompt,
-        expected_output="A 2–4 sentence professional alignment summary. The output must not contain any conversational filler and should start directly with the analysis.",
-        agent=sharepoint_kb_agent
-    )
-
-    crew_result = Crew(
-        agents=[sharepoint_kb_agent],
-        tasks=[task],
-        process="sequential"
-    ).kickoff().raw.strip()
+    crew_result = cached_completion(
+        "sharepoint", llm.model, prompt,
+        lambda: sharepoint_kb_pool.run(prompt), kb_version=snapshot["sharepoint_version"])
 
     unwanted_prefix = "Your final answer must be the great and the most complete as possible, it must be outcome described."
     if crew_result.startswith(unwanted_prefix):
@@ -166,17 +272,12 @@ def get_sharepoint_answer(question: str):
 
 def get_salesforce_answer(salesforce_query: str):
     """
-    Calls the Salesforce crew with the reliable prompt that was tested successfully.
+    Resolves the organization with the structured Salesforce query (falling back
+    to the Salesforce crew with the reliable prompt that was tested successfully).
     """
-    print(f"▶️ Preparing to call Salesforce Crew for organization: '{salesforce_query}'")
-    
-    prompt = (
-        f"The user is asking for information on the organization '{salesforce_query}'. "
-        f"Search Salesforce for all relevant records (like Account, Contacts, and open Opportunities) "
-        f"related to this organization and provide a comprehensive summary of your findings."
-    )
-    
-    result = fetch_salesforce_data(prompt)
+    print(f"▶️ Preparing Salesforce insights for organization: '{salesforce_query}'")
+
+    result = get_salesforce_insights(salesforce_query)
     
     # Wrap the raw text result in HTML for consistent formatting in the UI
     return f"""<div class="p-4 border rounded-lg shadow-sm">
@@ -186,7 +287,8 @@ def get_salesforce_answer(salesforce_query: str):
 
 # --- Flask Web App ---
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# Set FLASK_SECRET_KEY when running several workers, or sessions only work on the worker that created them
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
 
 CONVERSATION_FLOW = [
     {"key": "summary", "question": "I can help you by summarizing this prospect’s profile and suggesting relevant insights. Would you like me to start with a quick summary?"},
@@ -196,6 +298,14 @@ CONVERSATION_FLOW = [
     {"key": "salesforce_inquiry", "question": "I can pull the latest insights from Salesforce. Would you like me to proceed?"}
 ]
 
+@contextmanager
+def chat_turn(step: str):
+    """Times the turn and attributes its LLM tokens to the conversation; a new search starts a new conversation."""
+    if step == "search" or 'conversation_id' not in session:
+        session['conversation_id'] = uuid.uuid4().hex[:12]
+    with span("chat_turn", step=step), usage_scope(session['conversation_id'], step):
+        yield
+
 @app.route("/", methods=["GET", "POST"])
 def home():
     if 'messages' not in session:
@@ -203,42 +313,186 @@ def home():
     if request.method == "POST":
         action = request.form.get("action")
         if action == "select_profile":
-            handle_profile_selection()
+            with chat_turn("select_profile"):
+                handle_profile_selection()
         else:
             q = request.form.get("q", "").strip()
             if not q: return redirect(url_for('home'))
             session['messages'].append({"role": "user", "content": q})
 
             if session.get('awaiting_salesforce_id'):
-                handle_salesforce_id_response(q)
+                with chat_turn("salesforce_answer"):
+                    handle_salesforce_id_response(q)
             elif session.get('awaiting_yes_no'):
-                handle_guided_question_response(q)
+                step = session.get('question_step', 0)
+                key = CONVERSATION_FLOW[step]['key'] if step < len(CONVERSATION_FLOW) else "done"
+                with chat_turn(key):
+                    handle_guided_question_response(q)
             else:
-                handle_new_search(q)
+                with chat_turn("search"):
+                    handle_new_search(q)
     session.modified = True
     return render_template_string(HTML, messages=session.get('messages', []))
 
+@app.before_request
+def check_kb_version():
+    refresh_kb()
+
 @app.route('/update_kb', methods=['POST'])
 def update_kb():
-    global sharepoint_kb_context
     try:
         print("🔄 Attempting to refresh KB from SharePoint source...")
         latest_kb_content = get_sharepoint_kb()
-        update_kb_in_db(latest_kb_content)
-        sharepoint_kb_context = latest_kb_content
-        print("✅ KB reloaded from source and cache updated successfully.")
+        version = update_kb_in_db(latest_kb_content, activate=False)
+        # Build and store the digest before activating, so reloading workers only read it
+        load_kb_digest(latest_kb_content)
+        activate_kb_version(version)
+        # Other workers pick the new version up on their next version check
+        refresh_kb(force=True)
+        print(f"✅ KB reloaded from source and cache updated successfully (version {version}).")
         session['messages'].append({"role": "bot", "content": "✅ The SharePoint KB has been refreshed."})
     except Exception as e:
         print("❌ Error refreshing KB:", e)
         session['messages'].append({"role": "bot", "content": f"⚠️ Failed to refresh SharePoint KB: {e}"})
     return redirect(url_for('home'))
 
+def _collect_provider_metrics():
+    for name, s in search_router.stats().items():
+        set_gauge("lsha_provider_circuit_open", 1 if s["circuit"] != "closed" else 0, provider=name)
+        set_gauge("lsha_provider_quota_used_today", s["quota_used_today"], provider=name)
+        set_gauge("lsha_provider_error_rate", s["error_rate"], provider=name)
+
+describe("lsha_provider_circuit_open", "1 while the search provider's circuit breaker is open or half-open.")
+describe("lsha_provider_quota_used_today", "Search provider calls counted against today's quota.")
+describe("lsha_provider_error_rate", "Search provider error rate over the recent call window.")
+register_collector(_collect_provider_metrics)
+
+@app.route('/admin/kb/versions')
+def kb_versions():
+    """Stored SharePoint KB versions and the one this worker is serving."""
+    return jsonify({"serving": kb_snapshot["version"], "pid": os.getpid(), "versions": list_kb_versions()})
+
+@app.route('/admin/kb/rollback', methods=['POST'])
+def kb_rollback():
+    """Activates a stored KB version ({"version": n}); without one, the version before the active one."""
+    payload = request.get_json(silent=True) or {}
+    version = payload.get("version", request.form.get("version"))
+    try:
+        if isinstance(version, (bool, float)):
+            raise TypeError(version)
+        target = previous_kb_version() if version in (None, "") else int(version)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'version' must be an integer."}), 400
+    stored = get_kb_version(target) if target is not None else None
+    if not stored:
+        return jsonify({"error": f"KB version {target} is not stored." if target is not None else "There is no earlier KB version to roll back to."}), 400
+    # Like /update_kb: the digest exists before any worker can switch to this version
+    load_kb_digest(stored["content"])
+    active = activate_kb_version(target)
+    refresh_kb(force=True)
+    return jsonify({"active": active, "serving": kb_snapshot["version"]})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (per worker process)."""
+    return Response(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route('/admin/llm_usage')
+def llm_usage():
+    """Token usage per day, per step/agent and per conversation (?days=7&session=<id>)."""
+    try:
+        days = int(request.args.get("days", 7))
+    except ValueError:
+        return jsonify({"error": "'days' must be an integer."}), 400
+    if days < 1:
+        return jsonify({"error": "'days' must be at least 1."}), 400
+    return jsonify(usage_report(days=days, session_id=request.args.get("session")))
+
+@app.route('/salesforce_cache/invalidate', methods=['POST'])
+def salesforce_cache_invalidate():
+    """Drops cached Salesforce records for {"org": "<name or account id>"}, or all of them if omitted."""
+    payload = request.get_json(silent=True) or {}
+    org = (payload.get("org") or request.form.get("org") or "").strip() or None
+    removed = invalidate_salesforce_cache(org)
+    print(f"🔄 Salesforce cache invalidated for {org or 'all organizations'} ({removed} entries).")
+    return jsonify({"invalidated": org or "all", "entries_removed": removed})
+
+@app.route('/api/batch_lookup', methods=['POST'])
+def batch_lookup_api():
+    """
+    Batch prospect lookup. Accepts JSON {"queries": [...]} or an uploaded CSV/text
+    file under 'file', and streams one JSON record per line as lookups finish.
+    """
+    payload = request.get_json(silent=True) or {}
+    queries = payload.get("queries") or []
+    upload = request.files.get("file")
+    if upload:
+        suffix = os.path.splitext(upload.filename or "")[1] or ".txt"
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            upload.save(tmp.name)
+        try:
+            queries = load_queries(tmp.name)
+        finally:
+            os.remove(tmp.name)
+    if not queries:
+        return jsonify({"error": "Provide 'queries' as a JSON list or upload a CSV/text 'file'."}), 400
+
+    def option(name, default):
+        value = payload.get(name, request.form.get(name))
+        return default if value in (None, "") else value
+
+    try:
+        workers = int(option("workers", BATCH_WORKERS))
+        rate = float(option("rate", BATCH_RATE_PER_SEC))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'workers' must be an integer and 'rate' a number."}), 400
+    if workers < 1 or not rate > 0 or rate == float("inf"):
+        return jsonify({"error": "'workers' must be at least 1 and 'rate' greater than 0."}), 400
+    # Clients can ask for less parallelism or a slower rate, never more than the server allows
+    workers = min(workers, BATCH_MAX_WORKERS)
+    rate = min(rate, BATCH_MAX_RATE_PER_SEC)
+
+    def generate():
+        for record in iter_batch(queries, workers=workers, rate=rate):
+            yield json.dumps(record) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route('/api/recommendations', methods=['POST'])
+def recommendations_api():
+    """
+    Runs the recommendation crew for {"query": ..., "company": ...} and streams its
+    events as JSON lines: the lookup hits first, then the extracted profile, then
+    the recommendations (or an error).
+    """
+    # Imported on first use: the crew module opens the profile vector store and
+    # warms up the embedding model, which most workers never need
+    from crew_recommendation import run_pipeline_stream
+    payload = request.get_json(silent=True) or {}
+    query = str(payload.get("query") or request.form.get("query") or "").strip()
+    company = str(payload.get("company") or request.form.get("company") or "").strip()
+    if not query:
+        return jsonify({"error": "Provide the prospect as 'query'."}), 400
+    conversation_id = session.get('conversation_id') or uuid.uuid4().hex[:12]
+
+    def generate():
+        with usage_scope(conversation_id, "recommendations"):
+            for event in run_pipeline_stream(query, company):
+                yield json.dumps(event, default=str) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 def handle_new_search(q: str):
+    conversation_id = session.get('conversation_id')
     session.clear()
+    session['conversation_id'] = conversation_id
     session['messages'] = [{"role": "user", "content": q}]
     try:
-        entity_type = classify_entity(q)
+        # The lookup doesn't depend on the classification, so run them side by side
+        # and only join when filtering the hits: latency is max(classify, lookup).
+        classify_future = search_executor.submit(contextvars.copy_context().run, classify_entity, q)
         result = linkedin_contact_lookup(q)
+        entity_type = classify_future.result()
         all_hits = [parse_hit(h) for h in result.get("hits", [])]
         if entity_type == 'person':
             query_name_parts = [part.lower() for part in q.split() if part]
@@ -253,6 +507,9 @@ def handle_new_search(q: str):
             handle_single_profile(all_hits[0])
         else:
             session['messages'].append({"role": "bot", "content": "Sorry, I couldn't find any relevant profiles for that query."})
+    except QuotaExceededError as e:
+        print(f"[WARN] {e}")
+        session['messages'].append({"role": "bot", "content": f"Search is unavailable right now. Please try again later. {e}"})
     except Exception as e:
         if "429" in str(e):
             session['messages'].append({"role": "bot", "content": "Search quota exceeded. Please try again later."})
@@ -283,7 +540,9 @@ def handle_guided_question_response(user_input: str):
         if key == "salesforce_inquiry":
             session['awaiting_salesforce_id'] = True
             session.pop('awaiting_yes_no', None)
-            session['messages'].append({"role": "bot", "content": "Could you please provide your Salesforce ID, Lead ID, or Organization Name?"})
+            detected = session.get('detected_company')
+            hint = f" (Detected company: <strong>{detected}</strong>)" if detected else ""
+            session['messages'].append({"role": "bot", "content": f"Could you please provide your Salesforce ID, Lead ID, or Organization Name?{hint}"})
             return
         if key == "sharepoint_summary":
             try:
@@ -293,7 +552,11 @@ def handle_guided_question_response(user_input: str):
             except Exception as e:
                 session['messages'].append({"role": "bot", "content": f"Something went wrong while fetching SharePoint insights: {e}"})
         else:
-            answer = get_focused_answer(context, key)
+            try:
+                answer = get_focused_answer(context, key)
+            except PromptBudgetExceeded as e:
+                print(f"[WARN] {e}")
+                answer = "This prospect's context is too large to analyze within the configured prompt budget."
             session['messages'].append({"role": "bot", "content": answer})
     else:
         session['messages'].append({"role": "bot", "content": "Okay, skipping that."})
@@ -327,6 +590,11 @@ def handle_salesforce_id_response(salesforce_query: str):
         
 def handle_single_profile(profile_data):
     session['last_context'] = json.dumps(profile_data)
+    # Warm the Salesforce cache for the prospect's company while the rep reads the guided steps
+    company = (profile_data.get("company") or "").strip()
+    session['detected_company'] = company
+    if company:
+        prefetch_salesforce_snapshot(company)
     profile_html = format_initial_profile_display(profile_data)
     session['messages'].append({"role": "bot", "content": profile_html})
     session['question_step'] = 0
@@ -334,16 +602,39 @@ def handle_single_profile(profile_data):
     first_question = CONVERSATION_FLOW[0]['question']
     session['messages'].append({"role": "bot", "content": f"<p class='mt-4'>{first_question} </p>"})
 
+_LINKEDIN_SUFFIX = re.compile(r"\s*[|\-–]\s*LinkedIn\s*$", re.I)
+_EXPERIENCE = re.compile(r"Experience:\s*([^·,|\n]+)", re.I)
+
+def parse_company(h) -> str:
+    """
+    Current company from a search hit, or "" when there's no reliable one:
+    the "Experience:" field of the snippet/meta description, else the last
+    segment of a "Name - Title - Company | LinkedIn" title, else "Title at Company".
+    """
+    metas = (h.get("pagemap") or {}).get("metatags") or [{}]
+    texts = [h.get("snippet", ""), h.get("company", ""), metas[0].get("og:description", ""), metas[0].get("description", "")]
+    for text in texts:
+        match = _EXPERIENCE.search(text or "")
+        if match:
+            return match.group(1).strip()
+    title = _LINKEDIN_SUFFIX.sub("", h.get("designation", "") or "")
+    parts = [p.strip() for p in title.split(" - ")]
+    if len(parts) >= 3:
+        return parts[-1]
+    at_match = re.search(r"\bat\s+([^·,|]+)$", parts[-1], re.I)
+    return at_match.group(1).strip() if at_match else ""
+
 def parse_hit(h):
-    designation = h.get("designation", "")
     snippet = h.get("snippet", "")
-    company_match = re.search(r"(?:at |Experience:|\|)\s*([^·,]+)", snippet + " " + designation, re.I)
-    h["company"] = company_match.group(1).strip() if company_match else ""
+    h["company"] = parse_company(h)
     try:
         meta_desc = h.get('pagemap', {}).get('metatags', [{}])[0].get('og:description', snippet)
         h["skillset"] = meta_desc
     except (IndexError, KeyError):
         h["skillset"] = snippet
+    # The page metatags are only needed above; hits end up in the session cookie,
+    # which is capped at ~4 KB, so don't carry them along.
+    h.pop("pagemap", None)
     return h
 
 def create_profile_selection_message(profiles):
@@ -0,0 +1,277 @@
+#batch_lookup.py
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from linkedin_search_mcp import linkedin_contact_lookup
+from provider_router import QuotaExceededError
+from storage import connect, apply_migrations, DB_PATH
+
+load_dotenv()
+
+# === Config ===
+LOOKUP_CACHE_DB = os.getenv("LOOKUP_CACHE_DB", DB_PATH)
+LOOKUP_CACHE_TTL_HOURS = float(os.getenv("LOOKUP_CACHE_TTL_HOURS", "168"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_RATE_PER_SEC = float(os.getenv("BATCH_RATE_PER_SEC", "1.0"))
+# Upper bounds for values sent by API clients (/api/batch_lookup)
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+BATCH_MAX_RATE_PER_SEC = float(os.getenv("BATCH_MAX_RATE_PER_SEC", "5.0"))
+
+CSV_FIELDS = ["query", "status", "rank", "url", "designation", "company", "location", "phones", "source", "confidence", "error"]
+
+
+# === Lookup result cache ===
+LOOKUP_CACHE_MIGRATIONS = [
+    """
+        CREATE TABLE IF NOT EXISTS lookup_cache (
+            query_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created TIMESTAMP NOT NULL
+        )
+    """,
+]
+
+def init_lookup_cache():
+    apply_migrations("lookup_cache", LOOKUP_CACHE_MIGRATIONS, LOOKUP_CACHE_DB)
+
+def get_cached_lookup(query_key: str) -> dict | None:
+    cutoff = datetime.now() - timedelta(hours=LOOKUP_CACHE_TTL_HOURS)
+    with connect(LOOKUP_CACHE_DB) as conn:
+        row = conn.execute(
+            "SELECT result FROM lookup_cache WHERE query_key = ? AND created > ?",
+            (query_key, cutoff)
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def save_cached_lookup(query_key: str, result: dict):
+    with connect(LOOKUP_CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO lookup_cache (query_key, result, created) VALUES (?, ?, ?)",
+            (query_key, json.dumps(result), datetime.now())
+        )
+        conn.commit()
+
+
+# === Helpers ===
+def normalize_query(q: str) -> str:
+    return re.sub(r"\s+", " ", q or "").strip().lower()
+
+def load_queries(path: str) -> list:
+    """
+    Reads prospect queries from a CSV or a plain text file (one query per line).
+    CSVs may have a 'query' column, or 'name' plus an optional 'company' column;
+    otherwise the first column is used.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if not path.lower().endswith(".csv"):
+            return [line.strip() for line in f if line.strip()]
+        reader = csv.DictReader(f)
+        fields = [name.lower().strip() for name in (reader.fieldnames or [])]
+        queries = []
+        for row in reader:
+            row = {k.lower().strip(): (v or "").strip() for k, v in row.items() if k}
+            if "query" in fields:
+                q = row.get("query", "")
+            elif "name" in fields:
+                q = " ".join(p for p in [row.get("name", ""), row.get("company", "")] if p)
+            else:
+                q = row.get(fields[0], "") if fields else ""
+            if q:
+                queries.append(q)
+        return queries
+
+def dedupe_queries(queries: list) -> list:
+    seen, unique = set(), []
+    for q in queries:
+        key = normalize_query(q)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(q)
+    return unique
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads."""
+
+    def __init__(self, rate_per_sec: float, burst: int = 1):
+        self.rate = rate_per_sec
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# === Pipeline ===
+def lookup_one(query: str, limiter: RateLimiter) -> dict:
+    """Looks up one query, serving from the cache when possible."""
+    key = normalize_query(query)
+    try:
+        cached = get_cached_lookup(key)
+    except sqlite3.Error as e:
+        print(f"[WARN] Lookup cache read failed for '{query}', treating it as a miss: {e}")
+        cached = None
+    if cached is not None:
+        return {"query": query, "status": "ok", "cached": True, "result": cached}
+    limiter.acquire()
+    try:
+        result = linkedin_contact_lookup(query)
+    except QuotaExceededError as e:
+        return {"query": query, "status": "quota_exceeded", "error": str(e)}
+    except Exception as e:
+        return {"query": query, "status": "error", "error": str(e)}
+    try:
+        save_cached_lookup(key, result)
+    except sqlite3.Error as e:
+        print(f"[WARN] Lookup cache write failed for '{query}': {e}")
+    return {"query": query, "status": "ok", "cached": False, "result": result}
+
+def iter_batch(queries: list, workers: int = BATCH_WORKERS, rate: float = BATCH_RATE_PER_SEC, skip: set | None = None):
+    """
+    Runs deduplicated queries through a rate-limited thread pool and yields
+    each record as soon as it finishes (completion order, not input order).
+    """
+    init_lookup_cache()
+    skip = skip or set()
+    pending = [q for q in dedupe_queries(queries) if normalize_query(q) not in skip]
+    print(f"[INFO] Batch: {len(pending)} queries to run ({len(skip)} already done).")
+    limiter = RateLimiter(rate)
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = [pool.submit(lookup_one, q, limiter) for q in pending]
+        for future in as_completed(futures):
+            yield future.result()
+    except GeneratorExit:
+        # The consumer went away (e.g. the HTTP client disconnected): don't spend quota on queued lookups
+        print(f"[WARN] Batch abandoned; cancelling {sum(not f.done() for f in futures)} pending lookups.")
+        raise
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# === Output writers and checkpointing ===
+def _checkpoint_path(out_path: str) -> str:
+    return out_path + ".ckpt"
+
+def load_checkpoint(out_path: str) -> set:
+    path = _checkpoint_path(out_path)
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def _drop_retried_records(out_path: str, done: set, is_csv: bool):
+    """
+    Before a resumed run, removes output records for queries that aren't checkpointed
+    (errors, quota failures, a crash before the checkpoint write): they run again
+    and would otherwise appear twice.
+    """
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        return
+    tmp = out_path + ".tmp"
+    kept = dropped = 0
+    with open(out_path, newline="", encoding="utf-8") as src, open(tmp, "w", newline="", encoding="utf-8") as dst:
+        if is_csv:
+            reader = csv.DictReader(src)
+            writer = csv.DictWriter(dst, fieldnames=reader.fieldnames or CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            for row in reader:
+                if normalize_query(row.get("query", "")) in done:
+                    writer.writerow(row)
+                    kept += 1
+                else:
+                    dropped += 1
+        else:
+            for line in src:
+                try:
+                    keep = normalize_query(json.loads(line).get("query", "")) in done
+                except ValueError:
+                    keep = False  # a partial line from a crash
+                if keep:
+                    dst.write(line)
+                    kept += 1
+                else:
+                    dropped += 1
+    os.replace(tmp, out_path)
+    if dropped:
+        print(f"[INFO] Batch: removed {dropped} earlier records of queries that will be retried.")
+
+def record_to_rows(record: dict) -> list:
+    hits = (record.get("result") or {}).get("hits", [])
+    base = {"query": record["query"], "status": record["status"], "error": record.get("error", "")}
+    if not hits:
+        return [dict(base, rank="")]
+    return [
+        dict(base, rank=i + 1, url=h.get("url", ""), designation=h.get("designation", ""),
+             company=h.get("company", ""), location=h.get("location", ""),
+             phones=";".join(h.get("phones", [])), source=h.get("source", ""),
+             confidence=h.get("confidence", ""))
+        for i, h in enumerate(hits)
+    ]
+
+def run_batch(queries: list, out_path: str, workers: int = BATCH_WORKERS, rate: float = BATCH_RATE_PER_SEC, resume: bool = True) -> dict:
+    """
+    Streams batch results to JSONL or CSV (chosen by extension) as they finish.
+    Successful queries are appended to a '.ckpt' file next to the output, so a
+    rerun after a crash picks up where it stopped. Failed queries are retried.
+    """
+    done = load_checkpoint(out_path) if resume else set()
+    is_csv = out_path.lower().endswith(".csv")
+    if resume:
+        _drop_retried_records(out_path, done, is_csv)
+    write_header = is_csv and not (resume and os.path.exists(out_path) and os.path.getsize(out_path) > 0)
+    counts = {"ok": 0, "cached": 0, "error": 0, "quota_exceeded": 0, "skipped": len(done)}
+
+    with open(out_path, "a" if resume else "w", newline="", encoding="utf-8") as out, \
+            open(_checkpoint_path(out_path), "a" if resume else "w", encoding="utf-8") as ckpt:
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction="ignore") if is_csv else None
+        if write_header:
+            writer.writeheader()
+        for record in iter_batch(queries, workers=workers, rate=rate, skip=done):
+            if is_csv:
+                writer.writerows(record_to_rows(record))
+            else:
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+            if record.get("cached"):
+                counts["cached"] += 1
+            if record["status"] == "ok":
+                ckpt.write(normalize_query(record["query"]) + "\n")
+                ckpt.flush()
+            print(f"[INFO] Batch: {record['status']} - {record['query']}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch LinkedIn prospect lookup for account lists.")
+    parser.add_argument("input", help="CSV (query or name/company columns) or text file with one query per line")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="Output file (.jsonl or .csv)")
+    parser.add_argument("-w", "--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("-r", "--rate", type=float, default=BATCH_RATE_PER_SEC, help="Max uncached lookups per second")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the checkpoint and overwrite the output")
+    args = parser.parse_args()
+
+    summary = run_batch(load_queries(args.input), args.output, workers=args.workers, rate=args.rate, resume=not args.no_resume)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,156 @@
+#benchmarks/bench_e2e.py
+"""
+End-to-end benchmark, fully offline: replays recorded Google CSE, Tavily, DDG,
+LinkedIn, Graph and Gemini responses (see benchmarks/replay.py) with injected
+latency, and times
+
+    lookup      linkedin_contact_lookup(query)
+    kb          get_sharepoint_kb()
+    chat        one full conversation through app2: search (handle_new_search),
+                profile selection, then every CONVERSATION_FLOW step
+
+reporting p50/p95 latency per step, throughput and peak traced memory.
+
+    python benchmarks/bench_e2e.py [--iterations 5] [--workers 1] [--latency-scale 1.0]
+                                   [--latency gemini=200 ...] [--provider google|tavily|duckduckgo]
+                                   [--warm] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import replay
+
+QUERIES = ["Priya Raman", "Daniel Okafor", "Fiserv", "Keiko Tanaka at Honda"]
+# What the rep types when asked for the Salesforce organization (an account in the stub data)
+SALESFORCE_ORG = "Fiserv"
+PROVIDERS = {"google": "Google CSE", "tavily": "Tavily", "duckduckgo": "DuckDuckGo"}
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def timed(samples: dict, step: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        samples[step].append(time.perf_counter() - start)
+
+
+def run_chat(app2, query: str, samples: dict):
+    """Drives one rep's conversation through the Flask app, like the browser would."""
+    client = app2.app.test_client()
+    client.get("/")
+    timed(samples, "search", client.post, "/", data={"q": query})
+    with client.session_transaction() as sess:
+        pending = bool(sess.get("pending_profiles"))
+    if pending:
+        timed(samples, "select", client.post, "/", data={"action": "select_profile", "profile_index": "0"})
+    for flow_step in app2.CONVERSATION_FLOW:
+        timed(samples, flow_step["key"], client.post, "/", data={"q": "yes"})
+        with client.session_transaction() as sess:
+            awaiting_org = sess.get("awaiting_salesforce_id")
+        if awaiting_org:
+            timed(samples, "salesforce_answer", client.post, "/", data={"q": SALESFORCE_ORG})
+            break
+
+
+def run_scenario(name: str, iterations: int, workers: int, job) -> dict:
+    """Runs job(i, samples) iterations times on `workers` threads; returns the scenario report."""
+    samples = defaultdict(list)
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda i: job(i, samples), range(iterations)))
+    else:
+        for i in range(iterations):
+            job(i, samples)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    return {
+        "scenario": name,
+        "iterations": iterations,
+        "workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(iterations / elapsed, 3) if elapsed else 0.0,
+        "peak_mem_mb": round(peak / 1024 / 1024, 2),
+        "steps": {
+            step: {"n": len(values), "p50_ms": round(percentile(values, 50) * 1000, 1),
+                   "p95_ms": round(percentile(values, 95) * 1000, 1)}
+            for step, values in samples.items()
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"\n== {report['scenario']}: {report['iterations']} iterations, {report['workers']} worker(s), "
+          f"{report['elapsed_s']}s, {report['throughput_per_s']}/s, peak {report['peak_mem_mb']} MB")
+    print(f"   {'step':<24} {'n':>4} {'p50 ms':>10} {'p95 ms':>10}")
+    for step, stats in report["steps"].items():
+        print(f"   {step:<24} {stats['n']:>4} {stats['p50_ms']:>10} {stats['p95_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with recorded fixtures.")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1, help="concurrent iterations per scenario")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier on recorded latencies (0 = none)")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="SERVICE=MS",
+                        help=f"per-service latency override; services: {', '.join(replay.SERVICES)}")
+    parser.add_argument("--provider", choices=sorted(PROVIDERS), help="route every search to one provider")
+    parser.add_argument("--scenarios", nargs="*", default=["lookup", "kb", "chat"], choices=["lookup", "kb", "chat"])
+    parser.add_argument("--warm", action="store_true", help="keep the LLM and Salesforce caches enabled")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    replay.configure(latency_scale=args.latency_scale, overrides=replay.parse_overrides(args.latency))
+    workdir = replay.install(warm_caches=args.warm)
+    print(f"[INFO] Replay workdir: {workdir}")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    import app2  # noqa: E402 - must follow replay.install()
+    from linkedin_search_mcp import linkedin_contact_lookup
+    from sharepoint_kb import get_sharepoint_kb
+    startup_s = time.perf_counter() - start
+    if args.provider:
+        replay.only_provider(PROVIDERS[args.provider])
+    app2.mcp_pool.start()
+
+    reports = []
+    if "lookup" in args.scenarios:
+        reports.append(run_scenario("lookup", args.iterations, args.workers,
+                                    lambda i, s: timed(s, "linkedin_contact_lookup", linkedin_contact_lookup, QUERIES[i % len(QUERIES)])))
+    if "kb" in args.scenarios:
+        reports.append(run_scenario("kb", args.iterations, args.workers,
+                                    lambda i, s: timed(s, "get_sharepoint_kb", get_sharepoint_kb)))
+    if "chat" in args.scenarios:
+        reports.append(run_scenario("chat", args.iterations, args.workers,
+                                    lambda i, s: run_chat(app2, QUERIES[i % len(QUERIES)], s)))
+
+    print(f"\nStartup (import app2, KB load, agent setup): {startup_s:.2f}s")
+    for report in reports:
+        print_report(report)
+    print(f"\nBackend calls: {dict(replay.calls)}")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"startup_s": round(startup_s, 3), "calls": dict(replay.calls), "scenarios": reports}, f, indent=2)
+        print(f"[INFO] Results written to {json_path}")
+    app2.mcp_pool.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#benchmarks/bench_phone_extraction.py
+"""
+Micro-benchmark: staged phone extraction (regex pre-scan + phonenumbers on
+candidate windows) against the original full-text PhoneNumberMatcher scan.
+
+    python benchmarks/bench_phone_extraction.py [--repeat 20]
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import phonenumbers
+from linkedin_search_mcp import _extract_phones
+
+
+def legacy_extract_phones(text: str):
+    """The implementation _extract_phones replaced, kept here as the baseline."""
+    for match in phonenumbers.PhoneNumberMatcher(text, None):
+        yield phonenumbers.format_number(match.number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def make_profile_text(sections: int, phones: int, seed: int = 7) -> str:
+    """Builds LinkedIn-like page text full of dates, counts and ids, with a few real numbers."""
+    rng = random.Random(seed)
+    parts = []
+    for i in range(sections):
+        parts.append(
+            f"Senior Engineer at Company {i} · Full-time Jan {2000 + i % 24} - Present · "
+            f"{rng.randint(1, 12)} yrs {rng.randint(1, 11)} mos San Jose, California 95{rng.randint(100, 999)} "
+            f"Led a team of {rng.randint(3, 40)} engineers, cut costs by {rng.randint(5, 60)}% "
+            f"and shipped release 4.{rng.randint(0, 9)}.{rng.randint(0, 99)} to 1,{rng.randint(100, 999)},000 users."
+        )
+    samples = ["+1 415-555-0132", "+44 20 7946 0958", "+91 98450 12345", "+61 2 9374 4000 ext. 12"]
+    for n in range(phones):
+        parts.insert(rng.randrange(len(parts) + 1), f"Contact: {samples[n % len(samples)]}")
+    return " ".join(parts)
+
+
+# Separators phonenumbers accepts besides ASCII ones: Unicode dashes, minus sign, "~",
+# no-break and full-width spaces, full-width plus and brackets
+PUNCTUATION_CASES = [
+    "Call +1 415\u2013555\u20130132 now", "+1\u2011415\u2011555\u20110132", "+1 415\u2212555\u22120132",
+    "Tel: +44\u00a020\u00a07946\u00a00958", "\uff0b91\u300098450\u300012345", "+1 \uff08415\uff09 555\u20140132",
+    "Mobile +61~2~9374~4000, office +1 415\u2015555\u20150132 ext. 12",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = {
+        "no phones (300 sections)": make_profile_text(300, 0),
+        "2 phones (300 sections)": make_profile_text(300, 2),
+        "8 phones (1000 sections)": make_profile_text(1000, 8),
+    }
+    mismatches = [(t, list(legacy_extract_phones(t)), list(_extract_phones(t)))
+                  for t in PUNCTUATION_CASES if list(legacy_extract_phones(t)) != list(_extract_phones(t))]
+    print(f"punctuation variants: {len(PUNCTUATION_CASES) - len(mismatches)}/{len(PUNCTUATION_CASES)} match")
+    for text, legacy, staged in mismatches:
+        print(f"  MISMATCH {text!r}: legacy {legacy}, staged {staged}")
+    print(f"{'case':<28}{'chars':>9}{'legacy ms':>12}{'staged ms':>12}{'speedup':>10}  match")
+    for name, text in cases.items():
+        legacy = list(legacy_extract_phones(text))
+        staged = list(_extract_phones(text))
+        t_legacy = timeit.timeit(lambda: list(legacy_extract_phones(text)), number=args.repeat) / args.repeat
+        t_staged = timeit.timeit(lambda: list(_extract_phones(text)), number=args.repeat) / args.repeat
+        print(f"{name:<28}{len(text):>9}{t_legacy * 1000:>12.2f}{t_staged * 1000:>12.3f}"
+              f"{t_legacy / max(t_staged, 1e-9):>9.0f}x  {'ok' if legacy == staged else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    main()
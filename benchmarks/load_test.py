@@ -0,0 +1,265 @@
+#benchmarks/load_test.py
+"""
+Load test for app2: N simulated sales reps, each running full conversations
+(search -> select -> yes x5 -> Salesforce org) over HTTP against replayed
+backends (benchmarks/replay.py, stub Salesforce MCP).
+
+By default the app is served in-process by a WSGI server with a fixed pool of
+--threads request workers - one gunicorn worker with that many threads, where
+--threads 1 is the plain single-threaded sync worker. That mode also reports
+worker saturation: queue wait before a worker picks a request up, peak
+in-flight requests and worker utilization.
+
+To size a real deployment, point it at gunicorn serving the replayed app instead:
+
+    gunicorn -w 4 --threads 2 --chdir benchmarks replay_app:app -b 127.0.0.1:8000
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --reps 16
+
+    python benchmarks/load_test.py [--reps 8] [--conversations 2] [--threads 1]
+                                   [--think-ms 500] [--ramp-s 2] [--latency-scale 1.0]
+                                   [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+import http.cookiejar
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+import replay
+from bench_e2e import percentile, QUERIES, SALESFORCE_ORG
+
+SELECT_MARKER = 'value="select_profile"'
+SALESFORCE_MARKER = "Salesforce ID, Lead ID, or Organization Name"
+# Shown when the session cookie didn't carry the conversation (e.g. workers with different secret keys)
+LOST_CONTEXT_MARKER = "I've lost the context"
+COOKIE_LIMIT = 4093  # bytes browsers keep per cookie
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server whose requests run on a fixed pool of worker threads, with saturation stats."""
+
+    def __init__(self, *args, threads: int = 1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi-worker")
+        self.lock = threading.Lock()
+        self.in_flight = self.peak_in_flight = 0
+        self.busy_s = 0.0
+        self.queue_waits = []
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address, time.perf_counter())
+
+    def _handle(self, request, client_address, accepted: float):
+        started = time.perf_counter()
+        with self.lock:
+            self.queue_waits.append(started - accepted)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.lock:
+                self.in_flight -= 1
+                self.busy_s += time.perf_counter() - started
+
+    def saturation(self, wall_s: float) -> dict:
+        waits = self.queue_waits
+        return {
+            "worker_threads": self.threads,
+            "utilization": round(self.busy_s / (self.threads * wall_s), 3) if wall_s else 0.0,
+            "peak_in_flight": self.peak_in_flight,
+            "queue_wait_p50_ms": round(percentile(waits, 50) * 1000, 1),
+            "queue_wait_p95_ms": round(percentile(waits, 95) * 1000, 1),
+            "queue_wait_max_ms": round(max(waits, default=0) * 1000, 1),
+            "requests_queued_over_100ms": sum(1 for w in waits if w > 0.1),
+        }
+
+
+class Rep:
+    """One simulated sales rep with its own cookie jar (the Flask session lives in the cookie)."""
+
+    def __init__(self, base_url: str, think_s: float, rng: random.Random):
+        self.base_url = base_url.rstrip("/")
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.jar))
+        self.think_s = think_s
+        self.rng = rng
+
+    def session_cookie_bytes(self) -> int:
+        return sum(len(c.name) + len(c.value or "") for c in self.jar if c.name == "session")
+
+    def request(self, stats, step: str, data: dict = None) -> str:
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        start = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + "/", data=body, timeout=300) as resp:
+                html = resp.read().decode("utf-8", "replace")
+            error = "session lost (conversation context missing)" if LOST_CONTEXT_MARKER in html else None
+            stats.record(step, time.perf_counter() - start, self.session_cookie_bytes(), error=error)
+            return html
+        except Exception as e:
+            stats.record(step, time.perf_counter() - start, self.session_cookie_bytes(), error=str(e))
+            return ""
+        finally:
+            if self.think_s:
+                time.sleep(self.think_s * self.rng.uniform(0.5, 1.5))
+
+    def conversation(self, stats, query: str) -> bool:
+        """Returns True if the conversation reached the Salesforce answer."""
+        self.request(stats, "home")
+        html = self.request(stats, "search", {"q": query})
+        if SELECT_MARKER in html:
+            html = self.request(stats, "select", {"action": "select_profile", "profile_index": "0"})
+        for step in ("summary", "opportunity", "final_summary", "sharepoint_summary", "salesforce_inquiry"):
+            html = self.request(stats, step, {"q": "yes"})
+            if SALESFORCE_MARKER in html:
+                self.request(stats, "salesforce_answer", {"q": SALESFORCE_ORG})
+                return True
+        return False
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(list)
+        self.cookie_sizes = []
+        self.conversations = self.completed = 0
+
+    def finish(self, completed: bool):
+        with self.lock:
+            self.conversations += 1
+            self.completed += completed
+
+    def record(self, step: str, seconds: float, cookie_bytes: int, error: str = None):
+        with self.lock:
+            self.latencies[step].append(seconds)
+            self.cookie_sizes.append(cookie_bytes)
+            if error:
+                self.errors[step].append(error)
+
+    def report(self, wall_s: float) -> dict:
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "requests": total,
+            "errors": sum(len(v) for v in self.errors.values()),
+            "requests_per_s": round(total / wall_s, 2) if wall_s else 0.0,
+            "conversations": self.conversations,
+            "conversations_completed": self.completed,
+            "steps": {
+                step: {"n": len(values), "errors": len(self.errors.get(step, [])),
+                       "p50_ms": round(percentile(values, 50) * 1000, 1),
+                       "p95_ms": round(percentile(values, 95) * 1000, 1),
+                       "p99_ms": round(percentile(values, 99) * 1000, 1),
+                       "max_ms": round(max(values) * 1000, 1)}
+                for step, values in self.latencies.items()
+            },
+            "session_cookie": {
+                "p50_bytes": int(percentile(self.cookie_sizes, 50)),
+                "max_bytes": max(self.cookie_sizes, default=0),
+                "over_browser_limit": sum(1 for size in self.cookie_sizes if size > COOKIE_LIMIT),
+            },
+            "sample_errors": {step: errs[:3] for step, errs in self.errors.items()},
+        }
+
+
+def serve_in_process(threads: int):
+    import app2  # noqa: E402 - must follow replay.install()
+    app2.mcp_pool.start()
+    server = make_server("127.0.0.1", 0, app2.app, server_class=lambda *a, **k: PooledWSGIServer(*a, threads=threads, **k),
+                         handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", app2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated concurrent reps against app2 with replayed backends.")
+    parser.add_argument("--reps", type=int, default=8, help="concurrent simulated reps")
+    parser.add_argument("--conversations", type=int, default=2, help="conversations per rep")
+    parser.add_argument("--threads", type=int, default=1, help="in-process request worker threads")
+    parser.add_argument("--url", help="load an already running server instead (see replay_app.py)")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between a rep's requests")
+    parser.add_argument("--ramp-s", type=float, default=2.0, help="spread rep start times over this many seconds")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--latency", nargs="*", default=[], metavar="SERVICE=MS")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    server = app2 = None
+    if args.url:
+        base_url = args.url
+    else:
+        replay.configure(latency_scale=args.latency_scale, overrides=replay.parse_overrides(args.latency))
+        replay.install()
+        server, base_url, app2 = serve_in_process(args.threads)
+    print(f"[INFO] Load testing {base_url} with {args.reps} reps x {args.conversations} conversations")
+
+    stats = Stats()
+    rng = random.Random(args.seed)
+
+    def run_rep(index: int):
+        time.sleep(args.ramp_s * index / max(1, args.reps))
+        rep = Rep(base_url, args.think_ms / 1000, random.Random(rng.random()))
+        for n in range(args.conversations):
+            stats.finish(rep.conversation(stats, QUERIES[(index + n) % len(QUERIES)]))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.reps) as pool:
+        list(pool.map(run_rep, range(args.reps)))
+    wall_s = time.perf_counter() - start
+
+    result = {"reps": args.reps, "conversations_per_rep": args.conversations, "wall_s": round(wall_s, 2)}
+    result.update(stats.report(wall_s))
+    if server:
+        result["saturation"] = server.saturation(wall_s)
+        result["backend_calls"] = dict(replay.calls)
+
+    print(f"\n{result['requests']} requests in {result['wall_s']}s = {result['requests_per_s']} req/s, {result['errors']} errors")
+    print(f"   {'step':<20} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for step, s in result["steps"].items():
+        print(f"   {step:<20} {s['n']:>5} {s['errors']:>4} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    print(f"Conversations completed: {result['conversations_completed']}/{result['conversations']}")
+    if result["conversations_completed"] < result["conversations"]:
+        print("[WARN] Some conversations lost their state mid-flow. With several gunicorn workers this means the "
+              "session cookie isn't valid across workers: set the same FLASK_SECRET_KEY for all of them.")
+    cookie = result["session_cookie"]
+    print(f"\nSession cookie: p50 {cookie['p50_bytes']} B, max {cookie['max_bytes']} B, "
+          f"{cookie['over_browser_limit']} responses over the {COOKIE_LIMIT} B browser limit")
+    if "saturation" in result:
+        sat = result["saturation"]
+        print(f"Workers: {sat['worker_threads']} thread(s), utilization {sat['utilization']:.0%}, "
+              f"peak in-flight {sat['peak_in_flight']}, queue wait p50 {sat['queue_wait_p50_ms']} ms / "
+              f"p95 {sat['queue_wait_p95_ms']} ms / max {sat['queue_wait_max_ms']} ms, "
+              f"{sat['requests_queued_over_100ms']} requests queued >100 ms")
+    for step, errs in result["sample_errors"].items():
+        print(f"[WARN] {step}: {errs[0]}")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"[INFO] Results written to {json_path}")
+    if server:
+        server.shutdown()
+        app2.mcp_pool.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
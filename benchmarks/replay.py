@@ -0,0 +1,273 @@
+#benchmarks/replay.py
+"""
+Offline replay of every external service the app talks to, served from the
+recorded responses in benchmarks/fixtures/ with configurable injected latency:
+
+    google_cse  googleapiclient customsearch (profile + public info searches)
+    tavily      TavilyClient.search
+    duckduckgo  DDGS().text
+    linkedin    requests.get on linkedin.com/in/* profile pages
+    web         requests.get on the public KB pages scraped at startup
+    graph       msal token + requests.get on graph.microsoft.com (SharePoint KB)
+    gemini      crewai LLM.call (agents, crews and direct calls alike)
+
+Salesforce goes through the local stub MCP server (SALESFORCE_MCP_STUB=1).
+Any other outbound HTTP request fails, so a run can never touch the network.
+
+install() patches the client libraries and points every SQLite/Chroma store at
+a scratch directory; it must run before the app modules are imported.
+"""
+import os
+import re
+import json
+import time
+import random
+import tempfile
+import threading
+from collections import Counter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# The profile page fixture is raw HTML, so its recorded fetch time lives here
+LINKEDIN_PAGE_LATENCY_MS = 450
+SERVICES = ("google_cse", "tavily", "duckduckgo", "linkedin", "web", "graph", "gemini")
+
+_fixtures = {}
+_latency = {}
+_jitter = 0.0
+_rng = random.Random(42)
+_lock = threading.Lock()
+calls = Counter()
+
+
+def _fixture(name: str):
+    if name not in _fixtures:
+        path = os.path.join(FIXTURE_DIR, name)
+        with open(path, encoding="utf-8") as f:
+            _fixtures[name] = json.load(f) if name.endswith(".json") else f.read()
+    return _fixtures[name]
+
+def _wait(service: str, seconds: float = None):
+    """Counts the call and sleeps for the service's (jittered) recorded latency."""
+    with _lock:
+        calls[service] += 1
+        delay = _latency.get(service, 0.0) if seconds is None else seconds
+        if _jitter and delay:
+            delay *= _rng.uniform(1 - _jitter, 1 + _jitter)
+    if delay > 0:
+        time.sleep(delay)
+
+def _fill(value, name: str):
+    """Substitutes {name}/{slug} placeholders throughout a fixture value."""
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+    if isinstance(value, str):
+        return value.replace("{name}", name).replace("{slug}", slug)
+    if isinstance(value, list):
+        return [_fill(v, name) for v in value]
+    if isinstance(value, dict):
+        return {k: _fill(v, name) for k, v in value.items()}
+    return value
+
+def _name_from_query(query: str) -> str:
+    """'site:linkedin.com/in "Jane Doe"' / 'Jane AND Doe' -> 'Jane Doe'."""
+    quoted = re.search(r'"([^"]+)"', query)
+    name = quoted.group(1) if quoted else query
+    return re.sub(r"\s+AND\s+", " ", name).strip()
+
+
+# --- Search providers ---
+class _FakeCSERequest:
+    def __init__(self, q: str, num: int):
+        self.q, self.num = q, num
+
+    def execute(self):
+        _wait("google_cse")
+        fixture = _fixture("google_cse.json")
+        kind = "profile_items" if "linkedin.com/in" in self.q else "public_items"
+        return {"items": _fill(fixture[kind], _name_from_query(self.q))[:self.num]}
+
+class _FakeCSE:
+    def list(self, q: str, cx: str = None, num: int = 10, **kwargs):
+        return _FakeCSERequest(q, num)
+
+class _FakeCustomSearch:
+    def cse(self):
+        return _FakeCSE()
+
+def fake_build(service_name: str, version: str, developerKey: str = None, **kwargs):
+    return _FakeCustomSearch()
+
+class FakeTavilyClient:
+    def __init__(self, api_key: str = None, **kwargs):
+        self.api_key = api_key
+
+    def search(self, query: str, max_results: int = 5, **kwargs):
+        _wait("tavily")
+        results = _fill(_fixture("tavily.json")["results"], _name_from_query(query))
+        return {"query": query, "results": results[:max_results]}
+
+class FakeDDGS:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, keywords: str, max_results: int = None, **kwargs):
+        _wait("duckduckgo")
+        results = _fill(_fixture("duckduckgo.json")["results"], _name_from_query(keywords))
+        return results[:max_results] if max_results else results
+
+
+# --- HTTP (LinkedIn pages, public KB pages, Microsoft Graph) ---
+class ReplayNetworkError(Exception):
+    pass
+
+def _response(url: str, status: int, body):
+    import requests
+    resp = requests.models.Response()
+    resp.status_code = status
+    resp.url = url
+    resp._content = body if isinstance(body, bytes) else body.encode("utf-8")
+    resp.encoding = "utf-8"
+    resp.headers["Content-Type"] = "application/json" if isinstance(body, str) and body[:1] in "{[" else "text/html"
+    return resp
+
+def _graph_response(url: str):
+    _wait("graph")
+    graph = _fixture("graph.json")
+    path = url.split("/v1.0", 1)[-1]
+    if re.fullmatch(r"/sites/[^/]+:/.+", path):
+        return _response(url, 200, json.dumps(graph["site"]))
+    match = re.fullmatch(r"/sites/[^/]+/drive/(?:root|items/([^/]+))/(children|content)", path)
+    if match:
+        item_id, kind = match.group(1) or "root", match.group(2)
+        if kind == "children" and item_id in graph["children"]:
+            return _response(url, 200, json.dumps({"value": graph["children"][item_id]}))
+        if kind == "content" and item_id in graph["files"]:
+            return _response(url, 200, graph["files"][item_id].encode("utf-8"))
+    return _response(url, 404, json.dumps({"error": {"code": "itemNotFound", "message": "The resource could not be found."}}))
+
+def fake_request(self, method: str, url: str, *args, **kwargs):
+    if "linkedin.com/in/" in url:
+        _wait("linkedin")
+        slug = url.rstrip("/").rsplit("/", 1)[-1]
+        name = " ".join(part.capitalize() for part in slug.split("-") if part.isalpha())
+        return _response(url, 200, _fill(_fixture("linkedin_profile.html"), name))
+    if "graph.microsoft.com" in url:
+        return _graph_response(url)
+    pages = _fixture("web.json")["pages"]
+    if url in pages:
+        _wait("web")
+        return _response(url, 200, pages[url])
+    raise ReplayNetworkError(f"Offline replay: no fixture for {method} {url}")
+
+
+# --- Microsoft identity ---
+class FakeConfidentialClientApplication:
+    def __init__(self, client_id=None, authority=None, client_credential=None, **kwargs):
+        pass
+
+    def acquire_token_for_client(self, scopes=None, **kwargs):
+        _wait("graph", _fixture("graph.json").get("token_latency_ms", 0) / 1000)
+        return {"access_token": "replay-token", "token_type": "Bearer", "expires_in": 3599}
+
+
+# --- Gemini ---
+def gemini_text(prompt: str) -> str:
+    fixture = _fixture("gemini.json")
+    for response in fixture["responses"]:
+        if response["match"] in prompt:
+            return response["text"]
+    return fixture["default"]
+
+def fake_llm_call(self, messages, tools=None, callbacks=None, available_functions=None):
+    _wait("gemini")
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    prompt = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") != "system")
+    text = gemini_text(prompt)
+    # Agent executors expect the ReAct format they asked for in the system prompt
+    if any("Final Answer:" in str(m.get("content", "")) for m in messages):
+        return f"Thought: I now can give a great answer\nFinal Answer: {text}"
+    return text
+
+
+def configure(latency_scale: float = 1.0, overrides: dict = None, jitter: float = 0.1):
+    """Recorded latencies (latency_ms in each fixture) times latency_scale, plus per-service overrides in ms."""
+    global _jitter
+    files = {"google_cse": "google_cse.json", "tavily": "tavily.json", "duckduckgo": "duckduckgo.json",
+             "web": "web.json", "graph": "graph.json", "gemini": "gemini.json"}
+    for service, name in files.items():
+        _latency[service] = _fixture(name).get("latency_ms", 0) / 1000 * latency_scale
+    _latency["linkedin"] = LINKEDIN_PAGE_LATENCY_MS / 1000 * latency_scale
+    for service, ms in (overrides or {}).items():
+        if service not in SERVICES:
+            raise ValueError(f"Unknown service '{service}'; expected one of {', '.join(SERVICES)}")
+        _latency[service] = float(ms) / 1000
+    _jitter = jitter
+
+def parse_overrides(specs: list) -> dict:
+    """['gemini=200', 'graph=0'] -> {'gemini': 200.0, 'graph': 0.0}"""
+    overrides = {}
+    for spec in specs or []:
+        service, _, ms = spec.partition("=")
+        overrides[service.strip()] = float(ms)
+    return overrides
+
+
+def install(workdir: str = None, warm_caches: bool = False) -> str:
+    """
+    Patches the client libraries, sets dummy credentials and scratch stores,
+    and changes into workdir (sharepoint_kb keeps its download folders relative
+    to the working directory). Returns the workdir.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="lsha-replay-")
+    os.makedirs(workdir, exist_ok=True)
+    env = {
+        "GEMINI_API_KEY": "replay", "GOOGLE_API_KEY": "replay", "GOOGLE_CX": "replay", "TAVILY_API_KEY": "replay",
+        "SP_CLIENT_ID": "replay", "SP_CLIENT_SECRET": "replay", "SP_TENANT_ID": "replay",
+        "SP_SITE_DOMAIN": "replay.sharepoint.com", "SP_SITE_PATHS": "/sites/Offerings",
+        "SALESFORCE_MCP_STUB": "1", "GOOGLE_CSE_DAILY_QUOTA": "1000000",
+        # Every cache and the KB store default to this database (storage.DB_PATH)
+        "KB_CACHE_DB": os.path.join(workdir, "replay.db"),
+        "CHROMA_PERSIST_DIR": os.path.join(workdir, "chroma"),
+        "CREWAI_DISABLE_TELEMETRY": "true", "OTEL_SDK_DISABLED": "true",
+        # Shared across gunicorn workers so a rep's session cookie is valid on every worker
+        "FLASK_SECRET_KEY": os.getenv("FLASK_SECRET_KEY", "replay-secret"),
+    }
+    if not warm_caches:
+        env.update({"LLM_CACHE_ENABLED": "false", "SALESFORCE_CACHE_TTL_SECONDS": "0"})
+    # Before the imports below: crewai reads its telemetry switches at import time
+    os.environ.update(env)
+
+    import sys
+    import requests
+    import msal
+    import googleapiclient.discovery
+    import tavily
+    import duckduckgo_search
+    import crewai
+
+    requests.sessions.Session.request = fake_request
+    msal.ConfidentialClientApplication = FakeConfidentialClientApplication
+    googleapiclient.discovery.build = fake_build
+    tavily.TavilyClient = FakeTavilyClient
+    duckduckgo_search.DDGS = FakeDDGS
+    crewai.LLM.call = fake_llm_call
+
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    if not _latency:
+        configure()
+    return workdir
+
+def only_provider(name: str):
+    """Routes every search to one provider ('Google CSE', 'Tavily' or 'DuckDuckGo'); call after import."""
+    import linkedin_search_mcp
+    for provider in linkedin_search_mcp.providers:
+        provider["enabled"] = provider["name"] == name
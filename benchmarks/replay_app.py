@@ -0,0 +1,16 @@
+#benchmarks/replay_app.py
+"""
+WSGI entry point serving app2 against the replayed backends, for load tests
+against a real server:
+
+    gunicorn -w 4 --threads 2 --chdir benchmarks replay_app:app -b 127.0.0.1:8000
+
+REPLAY_LATENCY_SCALE scales the recorded backend latencies (default 1.0).
+"""
+import os
+import replay
+
+replay.configure(latency_scale=float(os.getenv("REPLAY_LATENCY_SCALE", "1.0")))
+replay.install()
+
+from app2 import app  # noqa: E402 - must follow replay.install()
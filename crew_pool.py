@@ -0,0 +1,72 @@
+#crew_pool.py
+import os
+import queue
+import threading
+from crewai import Agent, Task, Crew
+from metrics import span
+from token_usage import apply_budget, tracked_kickoff, tracked_call
+
+# "crew" runs single-task prompts through a pooled Crew (same output as before);
+# "direct" sends them straight to the agent's LLM, skipping the agent loop.
+LLM_EXECUTION_MODE = os.getenv("LLM_EXECUTION_MODE", "crew").lower()
+CREW_POOL_SIZE = int(os.getenv("CREW_POOL_SIZE", "4"))
+
+
+class CrewPool:
+    """
+    A fixed-size pool of pre-built single-task crews for one agent.
+    Each pooled crew owns a copy of the agent (CrewAI agents keep per-run
+    executor state, so they can't be shared across threads) and a task whose
+    description is a '{prompt}' template filled in at kickoff.
+    """
+
+    def __init__(self, agent: Agent, expected_output: str, size: int = CREW_POOL_SIZE):
+        self.agent = agent
+        self.expected_output = expected_output
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _build(self) -> Crew:
+        agent = self.agent.copy()
+        task = Task(description="{prompt}", expected_output=self.expected_output, agent=agent)
+        return Crew(agents=[agent], tasks=[task], process="sequential")
+
+    def _acquire(self) -> Crew:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._build()
+        return self._idle.get()
+
+    def kickoff(self, prompt: str):
+        crew = self._acquire()
+        try:
+            with span("llm_call", agent=self.agent.role, mode="crew"):
+                return tracked_kickoff(crew, self.agent.role, prompt, inputs={"prompt": prompt})
+        finally:
+            self._idle.put(crew)
+
+    def run(self, prompt: str) -> str:
+        """Answers a single-task prompt, through the pool or straight to the LLM."""
+        prompt = apply_budget(prompt, self.agent.role)
+        if LLM_EXECUTION_MODE == "direct":
+            return direct_completion(self.agent, prompt, self.expected_output)
+        return self.kickoff(prompt).raw.strip()
+
+
+def direct_completion(agent: Agent, prompt: str, expected_output: str = "") -> str:
+    """One LLM call with the agent's persona as the system prompt; no tool loop, no second turn."""
+    system = f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}"
+    user = prompt if not expected_output else f"{prompt}\n\nThis is the expected criteria for your final answer: {expected_output}"
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+    with span("llm_call", agent=agent.role, mode="direct"):
+        return tracked_call(agent.llm, messages, agent.role).strip()
@@ -1,50 +1,144 @@
-import os, json
+import os, json, re, time, queue, threading
+import contextvars
 from dotenv import load_dotenv
 from crewai import Agent, Task, Crew, LLM
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
-from typing import Type
+from typing import Type, Callable, Optional
 from linkedin_search_mcp import linkedin_contact_lookup
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+from embeddings import get_embedding_function, collection_name
+from metrics import span
+from token_usage import tracked_kickoff
+from storage import DATA_DIR
 import chromadb
 
 load_dotenv()
 llm = LLM(model="gemini/gemini-1.5-flash", api_key=os.getenv("GEMINI_API_KEY"))
 
-chroma_client = chromadb.Client()
-collection = chroma_client.get_or_create_collection("linkedin_profiles")
-tool_query_result = {}
+# Persistent semantic cache of lookup results
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", os.path.join(DATA_DIR, "chroma"))
+# Cosine distance above which the nearest cached profile is not treated as the same query.
+# Distances aren't comparable across embedding backends: trigram hashing puts different
+# names as close as a model puts paraphrases, so it gets a tighter default.
+PROFILE_MATCH_DEFAULT_DISTANCES = {"hash": 0.12}
+PROFILE_CACHE_TTL_HOURS = float(os.getenv("PROFILE_CACHE_TTL_HOURS", "168"))
+
+embedding_function = get_embedding_function()
+PROFILE_MATCH_MAX_DISTANCE = float(os.getenv("PROFILE_MATCH_MAX_DISTANCE")
+                                   or PROFILE_MATCH_DEFAULT_DISTANCES.get(embedding_function.backend, 0.15))
+chroma_client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+collection = chroma_client.get_or_create_collection(
+    collection_name("linkedin_profiles", embedding_function),
+    metadata={"hnsw:space": "cosine"},
+    embedding_function=embedding_function
+)
+# Lookup result of the last pipeline run in the current request context (see get_last_hits)
+_last_lookup_result = contextvars.ContextVar("last_lookup_result", default={})
+
+def _profile_id(query: str) -> str:
+    return re.sub(r"\s+", " ", query or "").strip().lower()
+
+def _same_name(query: str, other: str) -> bool:
+    """Every word of the shorter query appears in the longer one ("priya raman" != "priya ramanathan")."""
+    words, other_words = set(re.findall(r"\w+", query.lower())), set(re.findall(r"\w+", other.lower()))
+    return bool(words and other_words) and (words <= other_words or other_words <= words)
+
+def evict_expired_profiles() -> int:
+    """Deletes cached lookups older than PROFILE_CACHE_TTL_HOURS."""
+    cutoff = time.time() - PROFILE_CACHE_TTL_HOURS * 3600
+    expired = collection.get(where={"timestamp": {"$lt": cutoff}}, include=[])["ids"]
+    if expired:
+        collection.delete(ids=expired)
+        print(f"[INFO] Evicted {len(expired)} expired profile(s) from the vector DB.")
+    return len(expired)
+
+def find_cached_profile(query: str) -> dict | None:
+    """
+    Cached lookup for the same (normalized) query, else the nearest cached query
+    if it is close enough and names the same words. Expired entries are dropped
+    instead of returned.
+    """
+    key = _profile_id(query)
+    exact = collection.get(ids=[key], include=["metadatas"])
+    if exact["ids"]:
+        entry_id, metadata, distance = key, exact["metadatas"][0], 0.0
+    else:
+        if collection.count() == 0:
+            return None
+        nearest = collection.query(query_texts=[key], n_results=1, include=["metadatas", "distances"])
+        if not nearest["ids"] or not nearest["ids"][0]:
+            return None
+        entry_id, metadata, distance = nearest["ids"][0][0], nearest["metadatas"][0][0], nearest["distances"][0][0]
+        if distance > PROFILE_MATCH_MAX_DISTANCE:
+            print(f"[INFO] Nearest vector DB match '{metadata.get('query')}' too far (distance {distance:.3f}).")
+            return None
+        if not _same_name(key, metadata.get("query", "")):
+            print(f"[INFO] Nearest vector DB match '{metadata.get('query')}' is a different name (distance {distance:.3f}).")
+            return None
+    if time.time() - metadata.get("timestamp", 0) > PROFILE_CACHE_TTL_HOURS * 3600:
+        collection.delete(ids=[entry_id])
+        return None
+    return json.loads(metadata["result"])
+
+def store_profiles(items: list, source: str = "linkedin_contact_lookup"):
+    """
+    Batch upsert of (query, result) pairs; one embedding pass for the whole batch.
+    The query text is what gets embedded; the lookup result rides along in the metadata.
+    """
+    latest = {_profile_id(query): (query, result) for query, result in items}
+    if not latest:
+        return
+    now = time.time()
+    collection.upsert(
+        ids=list(latest),
+        documents=list(latest),
+        metadatas=[{"query": query, "source": source, "timestamp": now, "result": json.dumps(result)}
+                   for query, result in latest.values()]
+    )
+
+def store_profile(query: str, result: dict, source: str = "linkedin_contact_lookup"):
+    store_profiles([(query, result)], source)
+
+evict_expired_profiles()
+if os.getenv("EMBEDDING_WARMUP", "true").lower() in ("1", "true", "yes"):
+    threading.Thread(target=embedding_function.warm_up, daemon=True).start()
 
 class LinkedInQueryInput(BaseModel):
     person_query: str = Field(..., description="Name of person or company to look up")
 
 class LinkedInTool(BaseTool):
+    """
+    One instance per pipeline run: the lookup result is kept on the instance,
+    so concurrent requests never see each other's hits.
+    """
     name: str = "LinkedInContactLookup"
     description: str = "Search LinkedIn profiles and public info"
     args_schema: Type[BaseModel] = LinkedInQueryInput
+    last_result: dict = Field(default_factory=dict, exclude=True)
+    on_result: Optional[Callable[[dict], None]] = Field(default=None, exclude=True)
 
     def _run(self, person_query: str) -> str:
-        global tool_query_result
-
-        existing = collection.query(
-            query_texts=[person_query],
-            n_results=1
-        )
-        if existing['documents'] and existing['documents'][0]:
+        result = find_cached_profile(person_query)
+        if result is not None:
             print("[INFO] Found in vector DB")
-            result = json.loads(existing['documents'][0][0])
         else:
             print(f"[TOOL] Searching online for: {person_query}")
             result = linkedin_contact_lookup(person_query)
-            collection.add(
-                documents=[json.dumps(result)],
-                ids=[person_query]
-            )
+            if result.get("hits"):
+                store_profile(person_query, result)
 
-        tool_query_result = result
+        self.last_result = result
+        if self.on_result:
+            self.on_result(result)
         return json.dumps(result)
 
-lookup_tool = LinkedInTool()
+def hits_from(result: dict) -> list:
+    if "hits" in result:
+        return result["hits"]
+    elif "url" in result:
+        return [result]
+    else:
+        return []
 
 identifier = Agent(
     role="Entity Identifier",
@@ -54,14 +148,17 @@ identifier = Agent(
     llm=llm
 )
 
-info_extractor = Agent(
-    role="Info Extractor",
-    goal="Extract person/company info and public profile details",
-    backstory="Specialist in profiling from scraped data",
-    tools=[lookup_tool],
-    verbose=True,
-    llm=llm
-)
+def make_info_extractor(tool: LinkedInTool) -> Agent:
+    return Agent(
+        role="Info Extractor",
+        goal="Extract person/company info and public profile details",
+        backstory="Specialist in profiling from scraped data",
+        tools=[tool],
+        verbose=True,
+        llm=llm
+    )
+
+info_extractor = make_info_extractor(LinkedInTool())
 
 recommender = Agent(
     role="Business Recommender",
@@ -71,11 +168,21 @@ recommender = Agent(
     llm=llm
 )
 
-def build_tasks(query: str, input_company: str):
+def build_agents(tool: LinkedInTool) -> tuple:
+    """Fresh agents for one run; CrewAI agents keep per-run executor state."""
+    return identifier.copy(), make_info_extractor(tool), recommender.copy()
+
+def build_tasks(query: str, input_company: str, agents: tuple = None, profile_callback: Callable = None):
+    """
+    Classification and lookup don't depend on each other, so both run as async
+    tasks side by side; the recommender waits for both.
+    """
+    identifier_agent, extractor_agent, recommender_agent = agents or (identifier, info_extractor, recommender)
     task1 = Task(
         description=f"Is '{query}' a person or company?",
         expected_output="Return only 'person' or 'company'",
-        agent=identifier
+        agent=identifier_agent,
+        async_execution=True
     )
 
     task2 = Task(
@@ -97,8 +204,9 @@ If tool returns 'hits', pick the first one and convert to:
 - contact_info
 """,
         expected_output="JSON with background, role, company, location, public_url, contact_info",
-        agent=info_extractor,
-        context=[task1]
+        agent=extractor_agent,
+        async_execution=True,
+        callback=profile_callback
     )
 
     task3 = Task(
@@ -106,24 +214,62 @@ If tool returns 'hits', pick the first one and convert to:
 Given the info above, suggest 3 business recommendations from '{input_company}' to collaborate or pitch services.
 """,
         expected_output="3-5 specific business recommendations.",
-        agent=recommender,
-        context=[task2]
+        agent=recommender_agent,
+        context=[task1, task2]
     )
 
     return [task1, task2, task3]
 
 def run_pipeline(query: str, input_company: str):
+    """
+    Runs the recommendation crew for one request with its own agents and tool.
+    Returns (crew_output, hits); safe to call from many threads at once.
+    """
+    tool = LinkedInTool()
+    agents = build_agents(tool)
+    crew = Crew(
+        agents=list(agents),
+        tasks=build_tasks(query, input_company, agents),
+        verbose=True,
+    )
+    with span("llm_call", agent="recommendation_crew", mode="crew"):
+        output = tracked_kickoff(crew, "recommendation_crew", query)
+    _last_lookup_result.set(tool.last_result)
+    return output, hits_from(tool.last_result)
+
+def run_pipeline_stream(query: str, input_company: str):
+    """
+    Streaming run_pipeline: yields events as soon as they are available -
+    {"type": "hits"} when the lookup tool returns, {"type": "profile"} when
+    extraction finishes, then {"type": "recommendations"} (or {"type": "error"}).
+    """
+    events = queue.Queue()
+    tool = LinkedInTool(on_result=lambda result: events.put({"type": "hits", "hits": hits_from(result)}))
+    agents = build_agents(tool)
     crew = Crew(
-        agents=[identifier, info_extractor, recommender],
-        tasks=build_tasks(query, input_company),
+        agents=list(agents),
+        tasks=build_tasks(query, input_company, agents,
+                          profile_callback=lambda output: events.put({"type": "profile", "output": output.raw})),
         verbose=True,
     )
-    return crew.kickoff()
+
+    def _kickoff():
+        try:
+            with span("llm_call", agent="recommendation_crew", mode="crew"):
+                output = tracked_kickoff(crew, "recommendation_crew", query)
+            events.put({"type": "recommendations", "output": output.raw})
+        except Exception as e:
+            print(f"[ERROR] Recommendation pipeline failed for '{query}': {e}")
+            events.put({"type": "error", "error": str(e)})
+        finally:
+            events.put(None)
+
+    # Carry the caller's context (usage scope, trace) into the crew thread
+    threading.Thread(target=contextvars.copy_context().run, args=(_kickoff,), daemon=True).start()
+    while (event := events.get()) is not None:
+        yield event
+    _last_lookup_result.set(tool.last_result)
 
 def get_last_hits():
-    if "hits" in tool_query_result:
-        return tool_query_result["hits"]
-    elif "url" in tool_query_result:
-        return [tool_query_result]
-    else:
-        return []
+    """Hits of the last run_pipeline call in the current request context (kept for older callers)."""
+    return hits_from(_last_lookup_result.get())
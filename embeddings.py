@@ -0,0 +1,179 @@
+#embeddings.py
+"""
+Pluggable text embeddings for the profile vector store and KB chunks.
+EMBEDDING_BACKEND picks the model:
+  onnx                  - Chroma's bundled all-MiniLM-L6-v2 on onnxruntime, CPU only (default)
+  sentence-transformers - any sentence-transformers model on CPU (EMBEDDING_MODEL)
+  openai                - OpenAI embeddings API (needs OPENAI_API_KEY, network)
+  hash                  - character-trigram hashing; no model at all, for offline tests/benchmarks
+Vectors are cached in SQLite by model + text hash, so re-ingesting the same
+profiles or KB chunks never recomputes them.
+"""
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from array import array
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from storage import connect, apply_migrations, DB_PATH
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", DB_PATH)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_MODELS = {
+    "onnx": "all-MiniLM-L6-v2",
+    "sentence-transformers": "sentence-transformers/all-MiniLM-L6-v2",
+    "openai": "text-embedding-3-small",
+    "hash": "trigram-hash-384",
+}
+HASH_DIMENSIONS = 384
+
+
+def _hash_embed(texts: list) -> list:
+    vectors = []
+    for text in texts:
+        vector = [0.0] * HASH_DIMENSIONS
+        padded = " " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+        for i in range(len(padded) - 2):
+            bucket = int.from_bytes(hashlib.blake2b(padded[i:i + 3].encode("utf-8"), digest_size=4).digest(), "little")
+            vector[bucket % HASH_DIMENSIONS] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        vectors.append([v / norm for v in vector])
+    return vectors
+
+
+def _load_backend(backend: str, model: str):
+    """Returns a callable mapping a list of texts to a list of vectors."""
+    if backend == "hash":
+        return _hash_embed
+    if backend == "onnx":
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+        onnx = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+        return lambda texts: [list(map(float, v)) for v in onnx(texts)]
+    if backend == "sentence-transformers":
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("EMBEDDING_BACKEND=sentence-transformers needs 'pip install sentence-transformers'.")
+        st_model = SentenceTransformer(model, device="cpu")
+        return lambda texts: st_model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True).tolist()
+    if backend == "openai":
+        from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+        openai_fn = OpenAIEmbeddingFunction(api_key=os.getenv("OPENAI_API_KEY"), model_name=model)
+        return lambda texts: [list(map(float, v)) for v in openai_fn(texts)]
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'.")
+
+
+EMBEDDING_CACHE_MIGRATIONS = [
+    """
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            vector BLOB NOT NULL
+        )
+    """,
+]
+
+def init_embedding_cache():
+    apply_migrations("embedding_cache", EMBEDDING_CACHE_MIGRATIONS, EMBEDDING_CACHE_DB)
+
+def _cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+def _get_cached_vectors(keys: list) -> dict:
+    found = {}
+    with connect(EMBEDDING_CACHE_DB) as conn:
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT cache_key, vector FROM embedding_cache WHERE cache_key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+    return found
+
+def _put_cached_vectors(model: str, items: list):
+    with connect(EMBEDDING_CACHE_DB) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO embedding_cache (cache_key, model, vector) VALUES (?, ?, ?)",
+            [(key, model, array("f", vector).tobytes()) for key, vector in items]
+        )
+        conn.commit()
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """
+    Chroma embedding function over the configured backend. Texts are deduplicated,
+    served from the SQLite cache when possible, and the rest embedded in batches.
+    """
+
+    def __init__(self, backend: str = EMBEDDING_BACKEND, model: str = EMBEDDING_MODEL):
+        self.backend = backend
+        self.model = model or DEFAULT_MODELS.get(backend, "")
+        self.name = f"{backend}:{self.model}"
+        self._embed = None
+        self._lock = threading.Lock()
+        if EMBEDDING_CACHE_ENABLED:
+            init_embedding_cache()
+
+    def _backend(self):
+        with self._lock:
+            if self._embed is None:
+                print(f"[INFO] Loading embedding backend {self.name}...")
+                self._embed = _load_backend(self.backend, self.model)
+        return self._embed
+
+    def warm_up(self):
+        """Loads the model now instead of on the first query."""
+        try:
+            self._backend()(["warm up"])
+            print(f"✅ Embedding backend {self.name} ready.")
+        except Exception as e:
+            print(f"[WARN] Embedding warm-up failed for {self.name}: {e}")
+
+    def embed_texts(self, texts: list) -> list:
+        keys = [_cache_key(self.name, t) for t in texts]
+        vectors = _get_cached_vectors(list(set(keys))) if EMBEDDING_CACHE_ENABLED else {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            embed = self._backend()
+            items = list(missing.items())
+            computed = []
+            for start in range(0, len(items), EMBEDDING_BATCH_SIZE):
+                batch = items[start:start + EMBEDDING_BATCH_SIZE]
+                computed.extend(zip([k for k, _ in batch], embed([t for _, t in batch])))
+            vectors.update(computed)
+            if EMBEDDING_CACHE_ENABLED:
+                try:
+                    _put_cached_vectors(self.name, computed)
+                except sqlite3.Error as e:
+                    print(f"[WARN] Embedding cache write failed: {e}")
+        return [vectors[key] for key in keys]
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.embed_texts(list(input))
+
+
+_default = None
+_default_lock = threading.Lock()
+
+def get_embedding_function() -> CachedEmbeddingFunction:
+    """Process-wide embedding function for the configured backend."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = CachedEmbeddingFunction()
+        return _default
+
+def collection_name(base: str, embedding_function: CachedEmbeddingFunction) -> str:
+    """Per-model collection name, so switching backends never mixes vector dimensions."""
+    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", embedding_function.name).strip("-")
+    return f"{base}__{slug}"[:63].rstrip("-_")
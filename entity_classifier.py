@@ -0,0 +1,212 @@
+#entity_classifier.py
+import os
+import re
+import threading
+from collections import OrderedDict
+
+PERSON, COMPANY, PERSON_AT_COMPANY = "person", "company", "person + company"
+LABELS = (PERSON, COMPANY, PERSON_AT_COMPANY)
+
+# Optional newline-separated list of extra company names (e.g. exported from Salesforce)
+COMPANY_GAZETTEER_FILE = os.getenv("COMPANY_GAZETTEER_FILE", "")
+# Optional newline-separated list of extra given names (e.g. exported from the CRM's contacts)
+FIRST_NAMES_FILE = os.getenv("FIRST_NAMES_FILE", "")
+LABEL_CACHE_SIZE = int(os.getenv("ENTITY_LABEL_CACHE_SIZE", "2048"))
+
+KNOWN_COMPANIES = {
+    "accenture", "adobe", "amazon", "amd", "apple", "at&t", "atlassian", "bank of america", "boeing",
+    "capgemini", "cisco", "citi", "citibank", "cognizant", "dell", "deloitte", "ericsson", "ey",
+    "facebook", "fiserv", "ford", "general electric", "goldman sachs", "google", "hcl", "honda",
+    "hp", "ibm", "infosys", "intel", "intelliswift", "jpmorgan", "kpmg", "linkedin", "l&t",
+    "ltts", "meta", "microsoft", "morgan stanley", "netflix", "nvidia", "oracle", "paypal", "pwc",
+    "qualcomm", "salesforce", "samsung", "sap", "servicenow", "siemens", "sony", "tcs", "tesla",
+    "toyota", "uber", "verizon", "visa", "vmware", "walmart", "wells fargo", "wipro",
+}
+
+# Common given names. A short capitalized phrase only counts as a person when it starts
+# with one of these (or has an initial/particle); "Red Hat" or "Tata Steel" go to the LLM.
+FIRST_NAMES = {
+    # English / US
+    "aaron", "adam", "alan", "albert", "alex", "alexander", "alice", "alicia", "allison", "amanda", "amber",
+    "amy", "andrea", "andrew", "angela", "anna", "anne", "anthony", "ashley", "barbara", "ben", "benjamin",
+    "beth", "betty", "bill", "bob", "brandon", "brian", "bruce", "carl", "carol", "caroline", "catherine",
+    "charles", "charlotte", "chris", "christina", "christine", "christopher", "claire", "cynthia", "dan",
+    "daniel", "david", "dave", "deborah", "dennis", "diana", "donald", "donna", "dorothy", "douglas",
+    "edward", "elizabeth", "ellen", "emily", "emma", "eric", "frank", "gary", "george", "grace", "greg",
+    "gregory", "hannah", "harry", "heather", "helen", "henry", "jack", "jacob", "james", "jane", "janet",
+    "jason", "jeff", "jeffrey", "jennifer", "jeremy", "jessica", "jim", "joan", "joe", "john", "jonathan",
+    "joseph", "joshua", "judy", "julia", "julie", "justin", "karen", "kate", "katherine", "kathleen",
+    "kelly", "kevin", "kim", "kimberly", "larry", "laura", "lauren", "linda", "lisa", "liz", "lucy",
+    "margaret", "maria", "marie", "mark", "martha", "mary", "matt", "matthew", "megan", "melissa",
+    "michael", "michelle", "mike", "nancy", "nathan", "nicholas", "nicole", "olivia", "pamela", "patricia",
+    "patrick", "paul", "peter", "rachel", "raymond", "rebecca", "richard", "robert", "ronald", "rose",
+    "ruth", "ryan", "sam", "samantha", "samuel", "sandra", "sarah", "scott", "sharon", "shirley", "sophia",
+    "stephanie", "stephen", "steve", "steven", "susan", "thomas", "tim", "timothy", "tom", "tony",
+    "tyler", "victoria", "walter", "william", "zachary",
+    # Indian
+    "aarav", "abhishek", "aditi", "aditya", "ajay", "akash", "amit", "amita", "anand", "anil", "anita",
+    "anjali", "ankit", "anupam", "arjun", "arun", "arvind", "ashok", "deepa", "deepak", "divya", "gaurav",
+    "gopal", "harish", "kavita", "kiran", "krishna", "kumar", "lakshmi", "manish", "manoj", "meera",
+    "mohan", "nandini", "neha", "nikhil", "nisha", "pooja", "pradeep", "prakash", "pranav", "prashant",
+    "priya", "priyanka", "rahul", "raj", "rajesh", "rajiv", "ramesh", "ravi", "rohit", "sachin", "sandeep",
+    "sanjay", "santosh", "shreya", "shweta", "siddharth", "sneha", "srinivas", "sunil", "sunita", "suresh",
+    "swati", "varun", "venkat", "vijay", "vikram", "vinay", "vivek", "yash",
+    # Other
+    "ahmed", "alejandro", "ali", "ana", "carlos", "chen", "daniela", "diego", "elena", "fatima", "felipe",
+    "hans", "hiroshi", "ivan", "javier", "jorge", "jose", "juan", "keiko", "kenji", "li", "lucas", "luis",
+    "mateo", "mei", "miguel", "mohammed", "muhammad", "olga", "omar", "pablo", "pedro", "sofia", "wei",
+    "yuki", "yusuf",
+}
+# Lower-case particles inside a full name: "ludwig van beethoven", "maria de la cruz"
+NAME_PARTICLES = {"van", "von", "der", "de", "del", "della", "da", "di", "du", "la", "le", "bin", "binti", "al", "el", "ibn"}
+
+COMPANY_SUFFIXES = {
+    "inc", "inc.", "incorporated", "llc", "ltd", "ltd.", "limited", "corp", "corp.", "corporation",
+    "co", "co.", "company", "gmbh", "plc", "pvt", "pvt.", "ag", "sa", "llp", "group", "holdings",
+    "technologies", "technology", "tech", "solutions", "systems", "software", "labs", "consulting",
+    "services", "bank", "capital", "partners", "ventures", "industries", "networks", "digital",
+    "global", "international", "enterprises", "healthcare", "pharma", "motors", "airlines",
+}
+
+# Words that never appear in a plain person name; a query containing them is left to the LLM
+NON_NAME_WORDS = {
+    "the", "and", "of", "for", "in", "&", "university", "college", "institute", "school", "hospital",
+    "foundation", "agency", "department", "ministry", "council", "club", "association", "store",
+    "ceo", "cto", "cfo", "cio", "coo", "vp", "president", "director", "manager", "head", "lead",
+    "engineer", "architect", "developer", "consultant", "analyst", "founder", "officer", "recruiter",
+}
+
+_AT_PATTERN = re.compile(r"^(?P<person>.+?)(?:\s+at\s+|\s*@\s*)(?P<company>.+)$", re.I)
+_NAME_TOKEN = re.compile(r"^[a-z][a-z'\-]*\.?$|^[a-z]\.$", re.I)
+
+
+def _load_gazetteer() -> set:
+    names = set(KNOWN_COMPANIES)
+    if COMPANY_GAZETTEER_FILE and os.path.exists(COMPANY_GAZETTEER_FILE):
+        with open(COMPANY_GAZETTEER_FILE, encoding="utf-8") as f:
+            names.update(line.strip().lower() for line in f if line.strip())
+    return names
+
+def _load_first_names() -> set:
+    names = set(FIRST_NAMES)
+    if FIRST_NAMES_FILE and os.path.exists(FIRST_NAMES_FILE):
+        with open(FIRST_NAMES_FILE, encoding="utf-8") as f:
+            names.update(line.strip().lower() for line in f if line.strip())
+    return names
+
+_gazetteer = _load_gazetteer()
+_first_names = _load_first_names()
+_gazetteer_longest_first = sorted(_gazetteer, key=len, reverse=True)
+
+
+def _normalize(q: str) -> str:
+    return re.sub(r"\s+", " ", q or "").strip().lower()
+
+def _looks_like_company(text: str) -> bool:
+    text = _normalize(text)
+    tokens = text.split()
+    return bool(tokens) and (text in _gazetteer or tokens[-1] in COMPANY_SUFFIXES)
+
+def _looks_like_name(text: str) -> bool:
+    tokens = _normalize(text).split()
+    return (
+        1 <= len(tokens) <= 4
+        and all(_NAME_TOKEN.match(t) for t in tokens)
+        and not any(t in COMPANY_SUFFIXES or t in NON_NAME_WORDS or t in _gazetteer for t in tokens)
+    )
+
+def _has_name_evidence(text: str) -> bool:
+    """
+    Something beyond "a few capitalized words": a known given name first, an
+    initial ("j. smith", "john q public") or a particle between name parts.
+    """
+    tokens = _normalize(text).split()
+    if len(tokens) < 2:
+        return False
+    if tokens[0].rstrip(".") in _first_names:
+        return True
+    # "j. smith" or a middle initial; a bare leading letter ("a team") is not enough
+    if re.fullmatch(r"[a-z]\.", tokens[0]) or any(len(t.rstrip(".")) == 1 for t in tokens[1:-1]):
+        return True
+    return len(tokens) >= 3 and any(t in NAME_PARTICLES for t in tokens[1:-1])
+
+def _split_known_company(text: str) -> tuple[str, str] | None:
+    """Finds the longest gazetteer entry inside the query; returns (remainder, company)."""
+    padded = f" {text} "
+    for name in _gazetteer_longest_first:
+        if f" {name} " in padded:
+            remainder = padded.replace(f" {name} ", " ", 1).strip()
+            return remainder, name
+    return None
+
+
+# --- LRU of past labels (rules and LLM answers alike) ---
+_label_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def remember_label(q: str, label: str):
+    label = normalize_label(label)
+    if not label:
+        return
+    with _cache_lock:
+        _label_cache[_normalize(q)] = label
+        _label_cache.move_to_end(_normalize(q))
+        while len(_label_cache) > LABEL_CACHE_SIZE:
+            _label_cache.popitem(last=False)
+
+def _cached_label(q: str) -> str | None:
+    with _cache_lock:
+        label = _label_cache.get(_normalize(q))
+        if label:
+            _label_cache.move_to_end(_normalize(q))
+        return label
+
+
+def normalize_label(raw: str) -> str | None:
+    """Maps free-form LLM output onto one of the three labels."""
+    text = (raw or "").strip().strip("'\"`.").lower()
+    if "person" in text and "company" in text:
+        return PERSON_AT_COMPANY
+    if text in LABELS:
+        return text
+    if "company" in text:
+        return COMPANY
+    if "person" in text:
+        return PERSON
+    return None
+
+
+def classify_locally(q: str) -> str | None:
+    """
+    Classifies the query without an LLM when the answer is clear.
+    Returns 'person', 'company', 'person + company', or None when unsure.
+    """
+    text = _normalize(q)
+    if not text:
+        return None
+
+    cached = _cached_label(text)
+    if cached:
+        return cached
+
+    label = None
+    at_match = _AT_PATTERN.match(text)
+    if at_match:
+        if _looks_like_name(at_match.group("person")) and at_match.group("company").strip():
+            label = PERSON_AT_COMPANY
+    if not label:
+        if _looks_like_company(text):
+            label = COMPANY
+        else:
+            split = _split_known_company(text)
+            if split:
+                # Need a full name next to the company: "harrison ford" stays ambiguous
+                remainder, _ = split
+                if _looks_like_name(remainder) and _has_name_evidence(remainder):
+                    label = PERSON_AT_COMPANY
+            elif 2 <= len(text.split()) <= 4 and _looks_like_name(text) and _has_name_evidence(text):
+                label = PERSON
+
+    if label:
+        remember_label(text, label)
+    return label
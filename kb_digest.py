@@ -0,0 +1,216 @@
+#kb_digest.py
+"""
+Service catalog digest: a compact, structured summary of the website KB and the
+SharePoint KB, built once per KB version (by /update_kb, or in the background
+by one worker when it boots without one) and stored in SQLite. The summary, opportunity and final_summary prompts read the digest
+instead of the raw scraped text, so the expensive KB reading happens per
+refresh rather than per question.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+from datetime import datetime
+from llm_cache import fingerprint
+from prompt_budget import split_sections
+from token_usage import tracked_call, usage_scope
+from metrics import span
+from storage import connect, apply_migrations, DB_PATH
+
+KB_DIGEST_DB = os.getenv("KB_DIGEST_DB", DB_PATH)
+KB_DIGEST_ENABLED = os.getenv("KB_DIGEST_ENABLED", "true").lower() in ("1", "true", "yes")
+KB_DIGEST_MODE = os.getenv("KB_DIGEST_MODE", "llm").lower()  # "llm" or "extractive" (no LLM call)
+KB_DIGEST_KEEP_VERSIONS = int(os.getenv("KB_DIGEST_KEEP_VERSIONS", "5"))
+# A build claim older than this is treated as abandoned (its worker died) and can be taken over
+KB_DIGEST_BUILD_TIMEOUT_SECONDS = float(os.getenv("KB_DIGEST_BUILD_TIMEOUT_SECONDS", "600"))
+DIGEST_FORMAT = "1"  # bump when the digest layout changes, so stored digests are rebuilt
+
+DIGEST_PROMPT = """Build a service catalog digest from the knowledge base below: our public website pages and internal SharePoint documents.
+
+Return ONLY a JSON array, one object per distinct service or offering, with these keys:
+"service" (short name), "capabilities" (one sentence), "technologies" (list of named tools/platforms),
+"accelerators" (list of named accelerators/frameworks, may be empty), "outcomes" (list of concrete
+results or case-study figures, may be empty), "sources" (list of page URLs or document names used).
+Merge duplicates across sources. Use only facts stated in the knowledge base; no marketing filler.
+
+KNOWLEDGE BASE:
+{kb}"""
+
+
+KB_DIGEST_MIGRATIONS = [
+    """
+        CREATE TABLE IF NOT EXISTS kb_digest (
+            version TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            created TIMESTAMP NOT NULL
+        )
+    """,
+    # One row per digest being built: the cross-worker lock for background builds
+    """
+        CREATE TABLE IF NOT EXISTS kb_digest_builds (
+            version TEXT PRIMARY KEY,
+            pid INTEGER NOT NULL,
+            started REAL NOT NULL
+        )
+    """,
+]
+
+def init_digest_db():
+    apply_migrations("kb_digest", KB_DIGEST_MIGRATIONS, KB_DIGEST_DB)
+
+
+def digest_version(*kb_texts: str) -> str:
+    return fingerprint(DIGEST_FORMAT + "\x00" + "\x00".join(kb_texts))
+
+def get_digest(version: str) -> str | None:
+    with connect(KB_DIGEST_DB) as conn:
+        row = conn.execute("SELECT digest FROM kb_digest WHERE version = ?", (version,)).fetchone()
+    return row[0] if row else None
+
+def put_digest(version: str, digest: str, mode: str):
+    with connect(KB_DIGEST_DB) as conn:
+        conn.execute("INSERT OR REPLACE INTO kb_digest (version, digest, mode, created) VALUES (?, ?, ?, ?)",
+                     (version, digest, mode, datetime.now()))
+        conn.execute("""
+            DELETE FROM kb_digest WHERE version NOT IN (
+                SELECT version FROM kb_digest ORDER BY created DESC LIMIT ?
+            )
+        """, (KB_DIGEST_KEEP_VERSIONS,))
+        conn.commit()
+
+
+def render_digest(services: list) -> str:
+    """Services -> '# Service:' sections (the format prompt_budget.split_sections understands)."""
+    blocks = []
+    for s in services:
+        lines = [f"# Service: {s.get('service', '').strip()}"]
+        for key, label in (("capabilities", "Capabilities"), ("technologies", "Technologies"),
+                           ("accelerators", "Accelerators"), ("outcomes", "Outcomes"), ("sources", "Sources")):
+            value = s.get(key)
+            if isinstance(value, list):
+                value = "; ".join(str(v) for v in value if v)
+            if value:
+                lines.append(f"{label}: {str(value).strip()}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+def parse_services(raw: str) -> list:
+    match = re.search(r"\[.*\]", raw or "", re.S)
+    if not match:
+        raise ValueError("no JSON array in the digest response")
+    services = json.loads(match.group(0))
+    services = [s for s in services if isinstance(s, dict) and s.get("service")]
+    if not services:
+        raise ValueError("digest response has no services")
+    return services
+
+def extractive_digest(*kb_texts: str) -> str:
+    """LLM-free digest: the opening sentences of each page/document, boilerplate removed."""
+    services, by_source = [], {}
+    for text in kb_texts:
+        for source, section in split_sections(text):
+            by_source.setdefault(source, []).append(section)
+    for source, sections in by_source.items():
+        sentences = re.split(r"(?<=[.!?])\s+", " ".join(sections))
+        # Page titles read "DevOps Solutions | Intelliswift ..."; documents fall back to their file name
+        title = sentences[0].split(" | ")[0] if " | " in sentences[0][:80] else os.path.splitext(source)[0]
+        services.append({"service": title or "General", "capabilities": " ".join(sentences[:3])[:400],
+                         "sources": [source] if source else []})
+    return render_digest(services)
+
+
+def build_digest(llm, *kb_texts: str) -> tuple[str, str]:
+    """Returns (digest, mode). Falls back to the extractive digest if the LLM output can't be used."""
+    if KB_DIGEST_MODE == "llm" and llm is not None:
+        messages = [
+            {"role": "system", "content": "You are a precise analyst who catalogs a company's services."},
+            {"role": "user", "content": DIGEST_PROMPT.format(kb="\n\n".join(kb_texts))},
+        ]
+        try:
+            with span("llm_call", agent="kb_digest", mode="direct"), usage_scope("-", "kb_digest"):
+                return render_digest(parse_services(tracked_call(llm, messages, "kb_digest"))), "llm"
+        except Exception as e:
+            print(f"[WARN] LLM KB digest failed, using the extractive digest: {e}")
+    return extractive_digest(*kb_texts), "extractive"
+
+def stored_digest(*kb_texts: str) -> tuple[str, str]:
+    """
+    (digest, version) without calling the LLM: the stored digest for these KB
+    texts, or else an extractive one (not stored, so the real digest replaces it
+    once built). Used by hot reloads, which run inside user requests.
+    """
+    version = digest_version(*kb_texts)
+    try:
+        digest = get_digest(version)
+    except sqlite3.Error as e:
+        print(f"[WARN] KB digest read failed: {e}")
+        digest = None
+    if digest:
+        return digest, version
+    return extractive_digest(*kb_texts), f"{version}-extractive"
+
+def _claim_build(version: str) -> bool:
+    """Takes the build lock for this digest version unless a live build holds it."""
+    now = time.time()
+    with connect(KB_DIGEST_DB) as conn:
+        claimed = conn.execute("INSERT OR IGNORE INTO kb_digest_builds (version, pid, started) VALUES (?, ?, ?)",
+                               (version, os.getpid(), now)).rowcount
+        if not claimed:
+            claimed = conn.execute("UPDATE kb_digest_builds SET pid = ?, started = ? WHERE version = ? AND started < ?",
+                                   (os.getpid(), now, version, now - KB_DIGEST_BUILD_TIMEOUT_SECONDS)).rowcount
+        conn.commit()
+    return bool(claimed)
+
+def _release_build(version: str):
+    with connect(KB_DIGEST_DB) as conn:
+        conn.execute("DELETE FROM kb_digest_builds WHERE version = ? AND pid = ?", (version, os.getpid()))
+        conn.commit()
+
+def build_digest_once(llm, *kb_texts: str) -> bool:
+    """
+    Background build: digests these KB texts unless the digest is already stored
+    or another worker is building it. Returns whether this call built it.
+    """
+    version = digest_version(*kb_texts)
+    try:
+        if get_digest(version) or not _claim_build(version):
+            return False
+    except sqlite3.Error as e:
+        print(f"[WARN] KB digest build lock failed: {e}")
+        return False
+    try:
+        ensure_digest(llm, *kb_texts)
+        return True
+    except Exception as e:
+        print(f"[WARN] Background KB digest build failed: {e}")
+        return False
+    finally:
+        try:
+            _release_build(version)
+        except sqlite3.Error as e:
+            print(f"[WARN] KB digest build lock release failed: {e}")
+
+def ensure_digest(llm, *kb_texts: str) -> tuple[str, str]:
+    """
+    Returns (digest, version) for these KB texts, building and storing it only
+    if this KB version hasn't been digested yet.
+    """
+    version = digest_version(*kb_texts)
+    try:
+        digest = get_digest(version)
+    except sqlite3.Error as e:
+        print(f"[WARN] KB digest read failed: {e}")
+        digest = None
+    if digest:
+        print(f"[INFO] KB digest {version} loaded from cache.")
+        return digest, version
+    print(f"[INFO] Building KB digest {version}...")
+    digest, mode = build_digest(llm, *kb_texts)
+    try:
+        put_digest(version, digest, mode)
+    except sqlite3.Error as e:
+        print(f"[WARN] KB digest write failed: {e}")
+    print(f"✅ KB digest {version} built ({mode}, {len(digest)} chars).")
+    return digest, version
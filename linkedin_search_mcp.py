@@ -1,5 +1,6 @@
 
 import os
+import re
 import requests
 import phonenumbers
 from bs4 import BeautifulSoup
@@ -8,15 +9,26 @@ from googleapiclient.errors import HttpError as GoogleHttpError
 from dotenv import load_dotenv
 import json
 from mcp.server.fastmcp import FastMCP
+from provider_router import ProviderRouter, QuotaExceededError
+from metrics import span
 
 # Fallback imports
 from tavily import TavilyClient
 from duckduckgo_search import DDGS
 
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_CX_ID = os.getenv("GOOGLE_CX")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+GOOGLE_CSE_DAILY_QUOTA = int(os.getenv("GOOGLE_CSE_DAILY_QUOTA", "100"))
+TAVILY_DAILY_QUOTA = int(os.getenv("TAVILY_DAILY_QUOTA", "0"))  # 0 = no limit
+PROFILE_PARSER = os.getenv("PROFILE_PARSER", "lxml")  # "lxml" (fast) or "bs4"
+META_KEYS = ("og:description", "og:title", "description")
 
 mcp = FastMCP("linkedin-search-v2")
 
@@ -32,8 +44,10 @@ def _search_google_cse(query: str, k: int = 3):
             yield {"link": item.get("link"), "title": item.get("title"), "snippet": item.get("snippet")}
     except GoogleHttpError as e:
         print(f"[ERROR] Google CSE error: {e}")
+        raise
     except Exception as e:
         print(f"[ERROR] Google CSE failed: {e}")
+        raise
 
 def _search_tavily(query: str, k: int = 3):
     if not TAVILY_API_KEY:
@@ -46,6 +60,7 @@ def _search_tavily(query: str, k: int = 3):
             yield {"link": item.get("url"), "title": item.get("title"), "snippet": item.get("content")}
     except Exception as e:
         print(f"[ERROR] Tavily failed: {e}")
+        raise
 
 def _search_duckduckgo(query: str, k: int = 3):
     try:
@@ -55,10 +70,76 @@ def _search_duckduckgo(query: str, k: int = 3):
                     yield {"link": r.get("href"), "title": r.get("title"), "snippet": r.get("body")}
     except Exception as e:
         print(f"[ERROR] DuckDuckGo failed: {e}")
+        raise
+
+# With no default region phonenumbers only accepts numbers written with a leading
+# plus sign, so a cheap regex scan for "+<digits...>" finds every possible match.
+# The separators are phonenumbers' own punctuation set (Unicode dashes, "~", full-width
+# brackets...), so the pre-scan never rejects a number the matcher would accept.
+_PHONE_PUNCTUATION = getattr(phonenumbers.phonenumberutil, "_VALID_PUNCTUATION",
+                             "-x\u2010-\u2015\u2212\u30FC\uFF0D-\uFF0F \u00A0\u00AD\u200B\u2060\u3000"
+                             "()\uFF08\uFF09\uFF3B\uFF3D.\\[\\]/~\u2053\u223C\uFF5E")
+_PHONE_PLUS_CHARS = getattr(phonenumbers.phonenumberutil, "_PLUS_CHARS", "+\uFF0B")
+_PHONE_CANDIDATE_RE = re.compile(
+    rf"[{_PHONE_PLUS_CHARS}][{_PHONE_PUNCTUATION}\s]*\d[{_PHONE_PUNCTUATION}\d\s]{{4,}}\d")
+_WINDOW_BEFORE, _WINDOW_AFTER = 2, 16  # keep the matcher's boundary checks and "ext. 123" tails
+
+def _phone_candidate_windows(text: str):
+    """Yields small, non-overlapping slices of text around candidate digit runs."""
+    start = end = None
+    for m in _PHONE_CANDIDATE_RE.finditer(text):
+        s, e = max(0, m.start() - _WINDOW_BEFORE), min(len(text), m.end() + _WINDOW_AFTER)
+        if end is not None and s <= end:
+            end = max(end, e)
+            continue
+        if end is not None:
+            yield text[start:end]
+        start, end = s, e
+    if end is not None:
+        yield text[start:end]
 
 def _extract_phones(text: str):
-    for match in phonenumbers.PhoneNumberMatcher(text, None):
-        yield phonenumbers.format_number(match.number, phonenumbers.PhoneNumberFormat.E164)
+    if "+" not in text and "\uFF0B" not in text:
+        return
+    for window in _phone_candidate_windows(text):
+        for match in phonenumbers.PhoneNumberMatcher(window, None):
+            yield phonenumbers.format_number(match.number, phonenumbers.PhoneNumberFormat.E164)
+
+def _extract_page_lxml(html: str) -> tuple[str, dict]:
+    """Pulls only the <main>/<body> text nodes and the meta tags we use, via lxml's C parser."""
+    root = lxml.html.document_fromstring(html)
+    meta = {}
+    for tag in root.iterfind(".//meta"):
+        key = tag.get("property") or tag.get("name")
+        if key in META_KEYS and key not in meta:
+            meta[key] = (tag.get("content") or "").strip()
+    main = root.find(".//main")
+    if main is None:
+        main = root.find(".//body")
+    if main is None:
+        main = root
+    texts = main.xpath(".//text()[not(ancestor::script) and not(ancestor::style)]")
+    return " ".join(t.strip() for t in texts if t.strip()), meta
+
+def _extract_page_bs4(html: str) -> tuple[str, dict]:
+    soup = BeautifulSoup(html, "html.parser")
+    meta = {}
+    for tag in soup.find_all("meta"):
+        key = tag.get("property") or tag.get("name")
+        if key in META_KEYS and key not in meta:
+            meta[key] = (tag.get("content") or "").strip()
+    main = soup.find("main") or soup.find("body")
+    content = main.get_text(" ", strip=True) if main else soup.get_text(" ", strip=True)
+    return content, meta
+
+def _extract_page(html: str) -> tuple[str, dict]:
+    """Returns (page text, meta tags). Uses lxml unless PROFILE_PARSER=bs4 or lxml is unavailable."""
+    if PROFILE_PARSER == "lxml" and lxml is not None:
+        try:
+            return _extract_page_lxml(html)
+        except Exception as e:
+            print(f"[WARN] lxml extraction failed, falling back to BeautifulSoup: {e}")
+    return _extract_page_bs4(html)
 
 def _process_profile_url(url: str, title: str, snippet: str, source_name: str) -> dict | None:
     if not url or "linkedin.com/in/" not in url:
@@ -66,12 +147,12 @@ def _process_profile_url(url: str, title: str, snippet: str, source_name: str) -
         return None
     try:
         print(f"[INFO] {source_name}: Fetching {url}")
-        html = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10).text
-        soup = BeautifulSoup(html, "html.parser")
-        main = soup.find("main") or soup.find("body")
-        content = main.get_text(" ", strip=True) if main else soup.get_text(" ", strip=True)
-        phones = list(_extract_phones(content))
-        return {
+        with span("page_fetch", source=source_name):
+            html = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10).text
+        with span("extraction", kind="profile_page"):
+            content, meta = _extract_page(html)
+            phones = list(_extract_phones(content))
+        hit = {
             "url": url,
             "phones": phones,
             "designation": title,
@@ -79,6 +160,10 @@ def _process_profile_url(url: str, title: str, snippet: str, source_name: str) -
             "location": snippet,
             "source": source_name
         }
+        # Same shape as Google CSE's pagemap so parse_hit can read og:description
+        if meta:
+            hit["pagemap"] = {"metatags": [meta]}
+        return hit
     except Exception as e:
         print(f"[WARN] Failed to process {url}: {e}")
         return None
@@ -90,8 +175,13 @@ def _run_google_public_info_search(query: str, max_results=5) -> list:
         if not GOOGLE_API_KEY or not GOOGLE_CX_ID:
             print("[WARN] Google CSE creds missing. Skipping public info search.")
             return results
-        svc = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-        res = svc.cse().list(q=query, cx=GOOGLE_CX_ID, num=max_results).execute()
+        # Shares the Google CSE daily budget with the profile searches
+        if not router.consume_quota("Google CSE"):
+            print("[WARN] Google CSE daily quota exhausted. Skipping public info search.")
+            return results
+        with span("provider_search", provider="Google CSE public info"):
+            svc = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
+            res = svc.cse().list(q=query, cx=GOOGLE_CX_ID, num=max_results).execute()
         for item in res.get("items", []):
             results.append({
                 "title": item.get("title"),
@@ -102,6 +192,17 @@ def _run_google_public_info_search(query: str, max_results=5) -> list:
         print(f"[ERROR] Google public info search failed: {e}")
     return results
 
+# Cost is relative per-query spend: Google CSE is free inside its daily quota,
+# DuckDuckGo is free but rate-limited, Tavily consumes paid credits.
+providers = [
+    {"name": "Google CSE", "function": _search_google_cse, "cost": 0, "daily_quota": GOOGLE_CSE_DAILY_QUOTA,
+     "enabled": bool(GOOGLE_API_KEY and GOOGLE_CX_ID)},
+    {"name": "Tavily", "function": _search_tavily, "cost": 1, "daily_quota": TAVILY_DAILY_QUOTA,
+     "enabled": bool(TAVILY_API_KEY)},
+    {"name": "DuckDuckGo", "function": _search_duckduckgo, "cost": 0}
+]
+router = ProviderRouter(providers)
+
 @mcp.tool()
 def linkedin_contact_lookup(person_query: str) -> dict:
     """
@@ -112,19 +213,17 @@ def linkedin_contact_lookup(person_query: str) -> dict:
     processed_urls = set()
     max_successful_hits_to_return = 3
 
-    providers = [
-        {"name": "Google CSE", "function": _search_google_cse},
-        {"name": "Tavily", "function": _search_tavily},
-        {"name": "DuckDuckGo", "function": _search_duckduckgo}
-    ]
+    if not router.route():
+        reasons = ", ".join(f"{name}: {why}" for name, why in router.unavailable_reasons().items())
+        raise QuotaExceededError(f"No search provider is available ({reasons}).")
 
     def search_all_providers(query: str):
         hits = []
-        for provider in providers:
+        for provider in router.route():
             if len(final_hits) >= max_successful_hits_to_return:
                 break
             try:
-                results = provider["function"](query, k=3)
+                results = router.search(provider, query, k=3)
                 for item in results:
                     url = item.get("link")
                     if url and url not in processed_urls:
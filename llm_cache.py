@@ -0,0 +1,103 @@
+#llm_cache.py
+import os
+import re
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta
+from storage import connect, apply_migrations, DB_PATH
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", DB_PATH)
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "72"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+LLM_CACHE_MIGRATIONS = [
+    """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created TIMESTAMP NOT NULL,
+            last_access TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)
+    """,
+]
+
+def init_llm_cache():
+    apply_migrations("llm_cache", LLM_CACHE_MIGRATIONS, LLM_CACHE_DB)
+
+
+def fingerprint(text: str) -> str:
+    """Short, stable content hash, e.g. to version a KB snapshot."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt or "").strip()
+
+def make_key(namespace: str, model: str, prompt: str, kb_version: str = "") -> str:
+    raw = "\x00".join([namespace, model, kb_version, normalize_prompt(prompt)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached(key: str) -> str | None:
+    cutoff = datetime.now() - timedelta(hours=LLM_CACHE_TTL_HOURS)
+    with connect(LLM_CACHE_DB) as conn:
+        row = conn.execute(
+            "SELECT response FROM llm_cache WHERE cache_key = ? AND created > ?", (key, cutoff)
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE cache_key = ?", (datetime.now(), key))
+            conn.commit()
+            return row[0]
+    return None
+
+def put_cached(key: str, model: str, response: str):
+    now = datetime.now()
+    with connect(LLM_CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, model, response, now, now)
+        )
+        evict(conn)
+        conn.commit()
+
+def evict(conn: sqlite3.Connection):
+    """Drops expired rows, then the least recently used rows above the size limit."""
+    conn.execute("DELETE FROM llm_cache WHERE created <= ?", (datetime.now() - timedelta(hours=LLM_CACHE_TTL_HOURS),))
+    conn.execute("""
+        DELETE FROM llm_cache WHERE cache_key IN (
+            SELECT cache_key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+        )
+    """, (LLM_CACHE_MAX_ENTRIES,))
+
+def clear_llm_cache():
+    with connect(LLM_CACHE_DB) as conn:
+        conn.execute("DELETE FROM llm_cache")
+        conn.commit()
+
+
+def cached_completion(namespace: str, model: str, prompt: str, compute, kb_version: str = "") -> str:
+    """
+    Returns the cached answer for (namespace, model, KB version, normalized prompt),
+    or calls compute() and stores its result. Failures are never cached.
+    """
+    if not LLM_CACHE_ENABLED:
+        return compute()
+    key = make_key(namespace, model, prompt, kb_version)
+    try:
+        hit = get_cached(key)
+    except sqlite3.Error as e:
+        print(f"[WARN] LLM cache read failed: {e}")
+        hit = None
+    if hit is not None:
+        print(f"[INFO] LLM cache hit ({namespace}).")
+        return hit
+    response = compute()
+    if response:
+        try:
+            put_cached(key, model, response)
+        except sqlite3.Error as e:
+            print(f"[WARN] LLM cache write failed: {e}")
+    return response
@@ -0,0 +1,147 @@
+#metrics.py
+"""
+In-process stage timing. span() times a block (provider search, page fetch,
+LLM call, Graph call, extraction, chat turn) into a Prometheus histogram and,
+when TRACE_LOG_FILE is set, appends one JSON line per span with its trace and
+parent ids. render_prometheus() produces the text exposition served at /metrics.
+Metrics are per process: with several gunicorn workers, scrape each one.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "")
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_trace_lock = threading.Lock()
+_histograms = {}   # name -> {labels tuple -> [bucket counts..., sum, count]}
+_counters = {}     # name -> {labels tuple -> value}
+_gauges = {}       # name -> {labels tuple -> value}
+_help = {}
+_collectors = []
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+def describe(name: str, text: str):
+    _help[name] = text
+
+def observe(name: str, value: float, buckets: tuple = DEFAULT_BUCKETS, **labels):
+    """Adds one observation to a histogram."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        series = _histograms.setdefault(name, {"buckets": buckets, "series": {}})
+        counts = series["series"].setdefault(_key(labels), [0] * len(series["buckets"]) + [0.0, 0])
+        for i, bound in enumerate(series["buckets"]):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+def inc(name: str, value: float = 1, **labels):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[_key(labels)] = series.get(_key(labels), 0) + value
+
+def set_gauge(name: str, value: float, **labels):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges.setdefault(name, {})[_key(labels)] = value
+
+def register_collector(fn):
+    """fn() is called on every scrape; use it to refresh gauges from other modules' state."""
+    _collectors.append(fn)
+
+
+def _write_trace(record: dict):
+    try:
+        with _trace_lock, open(TRACE_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+    except OSError as e:
+        print(f"[WARN] Could not write trace log: {e}")
+
+@contextmanager
+def span(stage: str, **labels):
+    """
+    Times the block as lsha_stage_duration_seconds{stage=...}; failures also count
+    in lsha_stage_errors_total. Nested spans share the outer span's trace id.
+    """
+    parent = _current_span.get()
+    span_id = uuid.uuid4().hex[:16]
+    trace_id = parent["trace_id"] if parent else uuid.uuid4().hex
+    token = _current_span.set({"span_id": span_id, "trace_id": trace_id})
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        observe("lsha_stage_duration_seconds", duration, stage=stage, **labels)
+        if status != "ok":
+            inc("lsha_stage_errors_total", stage=stage, error=status, **labels)
+        if TRACE_LOG_FILE:
+            _write_trace({
+                "ts": time.time(), "trace_id": trace_id, "span_id": span_id,
+                "parent_id": parent["span_id"] if parent else None, "stage": stage,
+                "duration_ms": round(duration * 1000, 2), "status": status, "labels": labels,
+            })
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+def render_prometheus() -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            print(f"[WARN] Metrics collector failed: {e}")
+    lines = []
+    with _lock:
+        for name, hist in sorted(_histograms.items()):
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, counts in sorted(hist["series"].items()):
+                for bound, count in zip(hist["buckets"], counts):
+                    lines.append(f"{name}_bucket{_labels(key, (('le', repr(float(bound))),))} {count}")
+                lines.append(f"{name}_bucket{_labels(key, (('le', '+Inf'),))} {counts[-1]}")
+                lines.append(f"{name}_sum{_labels(key)} {counts[-2]:.6f}")
+                lines.append(f"{name}_count{_labels(key)} {counts[-1]}")
+        for kind, store in (("counter", _counters), ("gauge", _gauges)):
+            for name, series in sorted(store.items()):
+                lines.append(f"# HELP {name} {_help.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+describe("lsha_stage_duration_seconds", "Duration of instrumented stages (search, fetch, LLM, Graph, extraction, chat turn).")
+describe("lsha_stage_errors_total", "Instrumented stages that raised, by exception type.")
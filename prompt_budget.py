@@ -0,0 +1,148 @@
+#prompt_budget.py
+"""
+Assembles the guided-step prompts within a per-step token budget: the profile
+is reduced to its distinct fields (lookup hits repeat the snippet in several
+keys), boilerplate is stripped from the KB, and only the KB sections most
+relevant to the profile and question are included.
+"""
+import os
+import re
+import json
+import math
+from collections import Counter
+from token_usage import estimate_tokens
+
+PROMPT_BUDGET_TOKENS = int(os.getenv("PROMPT_BUDGET_TOKENS", "1200"))
+# Per-step overrides, e.g. {"summary": 600, "final_summary": 2000}
+_raw_budgets = os.getenv("PROMPT_STEP_BUDGETS", "")
+STEP_BUDGETS = {"summary": 700, "opportunity": 1100, "final_summary": 1600}
+STEP_BUDGETS.update({k: int(v) for k, v in (json.loads(_raw_budgets) if _raw_budgets else {}).items()})
+PROFILE_SHARE = float(os.getenv("PROMPT_PROFILE_SHARE", "0.35"))  # of the budget left after the template
+KB_SECTION_CHARS = int(os.getenv("KB_SECTION_CHARS", "600"))
+
+# Profile fields worth sending, in prompt order; everything else (pagemap, phones, source flags) is dropped
+PROFILE_FIELDS = [("designation", "Name/Title"), ("company", "Company"), ("location", "Snippet"),
+                  ("skillset", "Skills/About"), ("snippet", "Snippet")]
+_BOILERPLATE = [
+    r"\s*\|\s*LinkedIn\b", r"\b\d+\+? connections on LinkedIn\.?", r"©[^.\n]*",
+    r"\bServices Industries Insights Careers Contact\b", r"\bView [\w\s']+ profile on LinkedIn\b",
+]
+_BOILERPLATE_RE = re.compile("|".join(_BOILERPLATE), re.I)
+_SECTION_HEADER = re.compile(r"^(?:From (https?://\S+):|# (?:Document|Service): (.+))$", re.M)
+_WORD = re.compile(r"[a-z0-9][a-z0-9+#.\-]*[a-z0-9+#]|[a-z0-9]")
+_STOPWORDS = set("""a an and are as at be by for from has have in is it its of on or our that the their this to
+with we you your they them what which who how can about into over more most all any also both such""".split())
+
+
+def budget_for(step: str) -> int:
+    return STEP_BUDGETS.get(step, PROMPT_BUDGET_TOKENS)
+
+def strip_boilerplate(text: str) -> str:
+    return re.sub(r"[ \t]+", " ", _BOILERPLATE_RE.sub("", text or "")).strip()
+
+def _terms(text: str) -> list:
+    return [w for w in _WORD.findall((text or "").lower()) if w not in _STOPWORDS and len(w) > 1]
+
+def _clip(text: str, max_tokens: int) -> str:
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:·") + " …"
+
+
+def compact_profile(context) -> str:
+    """Profile JSON (or dict) -> one line per distinct field, boilerplate and duplicates removed."""
+    if isinstance(context, str):
+        try:
+            context = json.loads(context)
+        except ValueError:
+            return strip_boilerplate(context)
+    if not isinstance(context, dict):
+        return strip_boilerplate(str(context))
+    kept = []
+    for key, label in PROFILE_FIELDS:
+        value = strip_boilerplate(str(context.get(key) or ""))
+        if not value or value.lower() in ("linkedin", "n/a"):
+            continue
+        lowered = value.lower()
+        # Skip values already contained in a kept field; replace kept values this one contains
+        if any(lowered in v.lower() for _, v in kept):
+            continue
+        kept = [(l, v) for l, v in kept if v.lower() not in lowered]
+        kept.append((label, value))
+    return "\n".join(f"{label}: {value}" for label, value in kept)
+
+
+def split_sections(kb: str) -> list:
+    """Splits a KB into (source, text) sections of at most KB_SECTION_CHARS, one per page/document paragraph."""
+    sections = []
+    matches = list(_SECTION_HEADER.finditer(kb or ""))
+    if not matches:
+        parts = [("", kb or "")]
+    else:
+        parts = [(m.group(1) or m.group(2), kb[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(kb)])
+                 for i, m in enumerate(matches)]
+    seen = set()
+    for source, body in parts:
+        chunk = ""
+        for line in body.splitlines():
+            sep = "\n"
+            for sentence in re.split(r"(?<=[.!?])\s+", line):
+                sentence = strip_boilerplate(sentence)
+                # The same sentence repeated across pages (taglines, footers) is sent once
+                if not sentence or sentence.lower() in seen:
+                    continue
+                seen.add(sentence.lower())
+                if chunk and len(chunk) + len(sentence) + 1 > KB_SECTION_CHARS:
+                    sections.append((source, chunk))
+                    chunk = ""
+                chunk = f"{chunk}{sep}{sentence}" if chunk else sentence
+                sep = " "
+        if chunk:
+            sections.append((source, chunk))
+    return sections
+
+
+def select_sections(kb: str, query: str, max_tokens: int) -> str:
+    """Highest-scoring KB sections for the query (TF-IDF overlap) that fit in max_tokens, in KB order."""
+    sections = split_sections(kb)
+    if not sections or max_tokens <= 0:
+        return ""
+    docs = [Counter(_terms(text)) for _, text in sections]
+    df = Counter(term for doc in docs for term in doc)
+    query_terms = set(_terms(query))
+
+    def score(doc: Counter) -> float:
+        length = sum(doc.values()) or 1
+        return sum((doc[t] / length) * math.log(1 + len(docs) / df[t]) for t in query_terms if t in doc)
+
+    ranked = sorted(range(len(sections)), key=lambda i: score(docs[i]), reverse=True)
+    chosen, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(sections[i][1]) + 12
+        if used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+    lines, last_source = [], None
+    for i in sorted(chosen):
+        source, text = sections[i]
+        if source != last_source:
+            lines.append(f"[{source}]" if source else "")
+            last_source = source
+        lines.append(text)
+    return "\n".join(line for line in lines if line)
+
+
+def build_focused_prompt(context, question: str, step: str, kb: str) -> str:
+    """The get_focused_answer prompt, assembled to fit budget_for(step)."""
+    def render(profile: str, knowledge: str) -> str:
+        return (f"CONTEXT: {profile}\n\nKNOWLEDGE BASE: {knowledge}\n\nQUESTION: {question}\n\n"
+                "TASK: Answer the question as a concise summary in 3-7 lines. Focus only on the information "
+                "available. Do not mention what is missing. Do not use lists or bullet points.")
+
+    available = max(0, budget_for(step) - estimate_tokens(render("", "")))
+    profile = _clip(compact_profile(context), int(available * PROFILE_SHARE))
+    knowledge = select_sections(kb, f"{profile} {question}", available - estimate_tokens(profile))
+    return render(profile, knowledge)
@@ -0,0 +1,268 @@
+#provider_router.py
+import os
+import time
+import threading
+from collections import deque
+from datetime import date
+from metrics import span
+from storage import connect, apply_migrations, DB_PATH
+
+QUOTA_DB_FILE = os.getenv("SEARCH_QUOTA_DB", DB_PATH)
+# route() runs for every lookup; quota counters are re-read from SQLite at most this often
+QUOTA_CACHE_SECONDS = float(os.getenv("SEARCH_QUOTA_CACHE_SECONDS", "2"))
+QUOTA_MIGRATIONS = [
+    """
+        CREATE TABLE IF NOT EXISTS search_quota (
+            provider TEXT NOT NULL,
+            day TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (provider, day)
+        )
+    """,
+]
+
+# Circuit breaker states
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class QuotaExceededError(Exception):
+    """Raised when every search provider is over quota, has its circuit open or is disabled."""
+
+
+def _is_quota_error(e: Exception) -> bool:
+    resp = getattr(e, "resp", None)
+    status = getattr(resp, "status", None) or getattr(e, "status_code", None)
+    return str(status) == "429" or "429" in str(e) or "quota" in str(e).lower()
+
+
+class ProviderRouter:
+    """
+    Routes search queries across providers, cheapest healthy provider first.
+    Tracks a per-provider daily quota (shared across workers through SQLite),
+    rolling latency and error rate, and a circuit breaker that skips
+    providers which keep failing or timing out.
+    """
+
+    def __init__(self, providers: list, failure_threshold: int = 3, cooldown_seconds: float = 120,
+                 window: int = 20, slow_seconds: float = 8.0, max_error_rate: float = 0.5):
+        self.providers = providers
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.slow_seconds = slow_seconds
+        self.max_error_rate = max_error_rate
+        self._lock = threading.Lock()
+        self._state = {
+            p["name"]: {
+                "circuit": CLOSED,
+                "opened_at": 0.0,
+                "consecutive_failures": 0,
+                "trial_in_flight": False,
+                "latencies": deque(maxlen=window),
+                "outcomes": deque(maxlen=window),
+            }
+            for p in providers
+        }
+        self._quota_cache = {}  # name -> (used, read at)
+        self._init_quota_table()
+
+    # --- Daily quota (persisted so every gunicorn worker shares one budget) ---
+    def _init_quota_table(self):
+        apply_migrations("search_quota", QUOTA_MIGRATIONS, QUOTA_DB_FILE)
+
+    def _quota_used(self, name: str, fresh: bool = False) -> int:
+        """Calls used today; served from memory for QUOTA_CACHE_SECONDS unless fresh=True."""
+        with self._lock:
+            cached = self._quota_cache.get(name)
+        if not fresh and cached and time.monotonic() - cached[1] < QUOTA_CACHE_SECONDS:
+            return cached[0]
+        with connect(QUOTA_DB_FILE) as conn:
+            row = conn.execute(
+                "SELECT used FROM search_quota WHERE provider = ? AND day = ?",
+                (name, date.today().isoformat())
+            ).fetchone()
+        used = row[0] if row else 0
+        self._cache_quota(name, used)
+        return used
+
+    def _cache_quota(self, name: str, used: int):
+        with self._lock:
+            self._quota_cache[name] = (used, time.monotonic())
+
+    def consume_quota(self, name: str) -> bool:
+        """Atomically reserves one call from the provider's daily quota. Returns False if exhausted."""
+        provider = self._get(name)
+        limit = provider.get("daily_quota") if provider else None
+        if not limit:
+            return True
+        today = date.today().isoformat()
+        with connect(QUOTA_DB_FILE) as conn:
+            conn.execute("INSERT OR IGNORE INTO search_quota (provider, day, used) VALUES (?, ?, 0)", (name, today))
+            cur = conn.execute(
+                "UPDATE search_quota SET used = used + 1 WHERE provider = ? AND day = ? AND used < ?",
+                (name, today, limit)
+            )
+            used = conn.execute(
+                "SELECT used FROM search_quota WHERE provider = ? AND day = ?", (name, today)
+            ).fetchone()[0]
+            conn.commit()
+        self._cache_quota(name, used)
+        return cur.rowcount == 1
+
+    def _exhaust_quota(self, name: str):
+        provider = self._get(name)
+        if not provider or not provider.get("daily_quota"):
+            return
+        with connect(QUOTA_DB_FILE) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_quota (provider, day, used) VALUES (?, ?, ?)",
+                (name, date.today().isoformat(), provider["daily_quota"])
+            )
+            conn.commit()
+        self._cache_quota(name, provider["daily_quota"])
+
+    # --- Health tracking ---
+    def _get(self, name: str) -> dict | None:
+        return next((p for p in self.providers if p["name"] == name), None)
+
+    def _circuit_allows(self, state: dict) -> bool:
+        # Call with self._lock held
+        if state["circuit"] == CLOSED:
+            return True
+        if state["trial_in_flight"]:
+            return False
+        return state["circuit"] == HALF_OPEN or time.monotonic() - state["opened_at"] >= self.cooldown_seconds
+
+    def _is_available(self, provider: dict) -> bool:
+        """Read-only check; the circuit only moves to HALF_OPEN when search() claims the trial."""
+        if not provider.get("enabled", True):
+            return False
+        with self._lock:
+            if not self._circuit_allows(self._state[provider["name"]]):
+                return False
+        limit = provider.get("daily_quota")
+        return not limit or self._quota_used(provider["name"]) < limit
+
+    def unavailable_reasons(self) -> dict:
+        """Why each provider is currently skipped: disabled, circuit open or quota exhausted."""
+        reasons = {}
+        for p in self.providers:
+            if not p.get("enabled", True):
+                reasons[p["name"]] = "disabled"
+                continue
+            with self._lock:
+                circuit_ok = self._circuit_allows(self._state[p["name"]])
+            if not circuit_ok:
+                reasons[p["name"]] = "circuit open"
+            elif p.get("daily_quota") and self._quota_used(p["name"]) >= p["daily_quota"]:
+                reasons[p["name"]] = "daily quota exhausted"
+        return reasons
+
+    def _claim(self, name: str) -> bool:
+        """
+        Reserves the right to call the provider. After the cooldown exactly one
+        caller gets the trial request; the others skip the provider until
+        record_success/record_failure settles it.
+        """
+        state = self._state[name]
+        with self._lock:
+            if not self._circuit_allows(state):
+                return False
+            if state["circuit"] != CLOSED:
+                state["circuit"] = HALF_OPEN
+                state["trial_in_flight"] = True
+            return True
+
+    def _release(self, name: str):
+        """Gives back an unused trial (e.g. the quota ran out before the call was made)."""
+        state = self._state[name]
+        with self._lock:
+            if state["trial_in_flight"]:
+                state["trial_in_flight"] = False
+                state["circuit"] = OPEN
+
+    def _record(self, name: str, ok: bool, latency: float):
+        state = self._state[name]
+        with self._lock:
+            state["trial_in_flight"] = False
+            state["latencies"].append(latency)
+            state["outcomes"].append(ok)
+            if ok:
+                state["consecutive_failures"] = 0
+                state["circuit"] = CLOSED
+                return
+            state["consecutive_failures"] += 1
+            outcomes = state["outcomes"]
+            error_rate = outcomes.count(False) / len(outcomes)
+            if (state["circuit"] == HALF_OPEN
+                    or state["consecutive_failures"] >= self.failure_threshold
+                    or (len(outcomes) >= 5 and error_rate > self.max_error_rate)):
+                if state["circuit"] != OPEN:
+                    print(f"[WARN] Circuit opened for {name} (error rate {error_rate:.0%}).")
+                state["circuit"] = OPEN
+                state["opened_at"] = time.monotonic()
+
+    def _trip(self, name: str):
+        state = self._state[name]
+        with self._lock:
+            state["circuit"] = OPEN
+            state["opened_at"] = time.monotonic()
+            state["trial_in_flight"] = False
+
+    def record_success(self, name: str, latency: float):
+        self._record(name, True, latency)
+
+    def record_failure(self, name: str, latency: float):
+        self._record(name, False, latency)
+
+    # --- Routing ---
+    def route(self) -> list:
+        """Returns the healthy providers ordered by cost, keeping list order as the tie-breaker."""
+        ranked = sorted(enumerate(self.providers), key=lambda ip: (ip[1].get("cost", 0), ip[0]))
+        return [p for _, p in ranked if self._is_available(p)]
+
+    def search(self, provider: dict, query: str, k: int = 3) -> list:
+        """Runs one provider search, recording quota, latency and outcome."""
+        name = provider["name"]
+        if not self._claim(name):
+            print(f"[INFO] {name} circuit is open or its trial request is in flight. Skipping.")
+            return []
+        if not self.consume_quota(name):
+            self._release(name)
+            print(f"[WARN] {name} daily quota exhausted. Skipping.")
+            return []
+        start = time.monotonic()
+        try:
+            with span("provider_search", provider=name):
+                results = list(provider["function"](query, k=k) or [])
+        except Exception as e:
+            self.record_failure(name, time.monotonic() - start)
+            if _is_quota_error(e):
+                print(f"[ERROR] {name} quota exceeded: {e}")
+                self._exhaust_quota(name)
+                self._trip(name)
+            raise
+        latency = time.monotonic() - start
+        # A call that succeeds but is too slow still counts against the provider
+        if latency <= self.slow_seconds:
+            self.record_success(name, latency)
+        else:
+            self.record_failure(name, latency)
+        return results
+
+    def stats(self) -> dict:
+        out = {}
+        for p in self.providers:
+            state = self._state[p["name"]]
+            with self._lock:
+                latencies = sorted(state["latencies"])
+                outcomes = list(state["outcomes"])
+                circuit = state["circuit"]
+            out[p["name"]] = {
+                "circuit": circuit,
+                "cost": p.get("cost", 0),
+                "daily_quota": p.get("daily_quota"),
+                "quota_used_today": self._quota_used(p["name"]),
+                "p50_latency": latencies[len(latencies) // 2] if latencies else None,
+                "error_rate": round(outcomes.count(False) / len(outcomes), 2) if outcomes else 0.0,
+            }
+        return out
@@ -0,0 +1,127 @@
+#salesforce_cache.py
+import os
+import re
+import json
+import time
+from storage import connect, apply_migrations, DB_PATH
+
+SALESFORCE_CACHE_DB = os.getenv("SALESFORCE_CACHE_DB", DB_PATH)
+SALESFORCE_CACHE_TTL_SECONDS = float(os.getenv("SALESFORCE_CACHE_TTL_SECONDS", "900"))
+# Revalidation restarts the TTL window; past this age (since the full fetch) the org is always refetched
+SALESFORCE_CACHE_MAX_AGE_SECONDS = float(os.getenv("SALESFORCE_CACHE_MAX_AGE_SECONDS", "86400"))
+# Per-account freshness windows, e.g. {"001A000001": 60, "fiserv": 3600} (account id or org name)
+_raw_overrides = os.getenv("SALESFORCE_CACHE_TTL_OVERRIDES", "")
+TTL_OVERRIDES = {k.strip().lower(): float(v) for k, v in (json.loads(_raw_overrides) if _raw_overrides else {}).items()}
+
+_MODSTAMP = re.compile(r"SystemModstamp\"?\s*[:=]\s*\"?(\d{4}-\d{2}-\d{2}T[0-9:.]+(?:Z|[+-]\d{2}:?\d{2})?)")
+_ACCOUNT_ID = re.compile(r"\b001[0-9A-Za-z]{12}(?:[0-9A-Za-z]{3})?\b")
+_RECORD_ID = re.compile(r"\bId\"?\s*[:=]\s*\"?([0-9A-Za-z]{15}(?:[0-9A-Za-z]{3})?)\b")
+
+
+SALESFORCE_CACHE_MIGRATIONS = [
+    """
+        CREATE TABLE IF NOT EXISTS salesforce_snapshots (
+            cache_key TEXT PRIMARY KEY,
+            account_ids TEXT NOT NULL,
+            snapshot TEXT NOT NULL,
+            max_modstamp TEXT,
+            fetched_at REAL NOT NULL,
+            validated_at REAL NOT NULL
+        )
+    """,
+    # Snapshots used to be copied under every account id they contained; an id lookup
+    # must not return other accounts' records, so drop those multi-account copies
+    """
+        DELETE FROM salesforce_snapshots
+        WHERE cache_key GLOB '001*' AND length(cache_key) IN (15, 18) AND account_ids LIKE '%,%'
+    """,
+]
+
+def init_salesforce_cache():
+    apply_migrations("salesforce_cache", SALESFORCE_CACHE_MIGRATIONS, SALESFORCE_CACHE_DB)
+
+
+def normalize_key(org_or_id: str) -> str:
+    return re.sub(r"\s+", " ", org_or_id or "").strip().lower()
+
+def max_modstamp(snapshot: dict) -> str | None:
+    """Latest SystemModstamp anywhere in the snapshot (account, contacts or opportunities)."""
+    stamps = _MODSTAMP.findall(json.dumps(snapshot, default=str))
+    return max(stamps) if stamps else None
+
+def record_ids(snapshot: dict) -> set:
+    """Ids of every record in the snapshot: accounts, contacts and opportunities."""
+    return set(_RECORD_ID.findall(json.dumps(snapshot, default=str)))
+
+def account_ids(snapshot: dict) -> list:
+    return sorted(set(_ACCOUNT_ID.findall(json.dumps(snapshot, default=str))))
+
+def ttl_for(key: str, ids: list) -> float:
+    """Shortest configured freshness window among the org name and its account ids."""
+    candidates = [TTL_OVERRIDES[k] for k in [key] + [i.lower() for i in ids] if k in TTL_OVERRIDES]
+    return min(candidates) if candidates else SALESFORCE_CACHE_TTL_SECONDS
+
+
+def get_entry(org_or_id: str) -> dict | None:
+    """
+    Returns the cached entry (fresh or stale) with a 'fresh' flag, or None.
+    An account id with no entry of its own resolves to an org snapshot holding
+    only that account; snapshots that also carry other accounts don't match.
+    """
+    key = normalize_key(org_or_id)
+    columns = "cache_key, account_ids, snapshot, max_modstamp, fetched_at, validated_at"
+    with connect(SALESFORCE_CACHE_DB) as conn:
+        row = conn.execute(f"SELECT {columns} FROM salesforce_snapshots WHERE cache_key = ?", (key,)).fetchone()
+        if not row and _ACCOUNT_ID.fullmatch((org_or_id or "").strip()):
+            row = conn.execute(
+                f"SELECT {columns} FROM salesforce_snapshots WHERE account_ids = ? ORDER BY fetched_at DESC LIMIT 1",
+                (json.dumps([org_or_id.strip()]),)
+            ).fetchone()
+    if not row:
+        return None
+    key, row = row[0], row[1:]
+    ids = json.loads(row[0])
+    return {
+        "key": key,
+        "account_ids": ids,
+        "snapshot": json.loads(row[1]),
+        "max_modstamp": row[2],
+        "fetched_at": row[3],
+        "validated_at": row[4],
+        "fresh": time.time() - row[4] < ttl_for(key, ids),
+        "expired": time.time() - row[3] > SALESFORCE_CACHE_MAX_AGE_SECONDS,
+    }
+
+def put_snapshot(org_or_id: str, snapshot: dict):
+    """Stores the snapshot under the org (or account id) it was fetched for."""
+    now = time.time()
+    with connect(SALESFORCE_CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO salesforce_snapshots (cache_key, account_ids, snapshot, max_modstamp, fetched_at, validated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (normalize_key(org_or_id), json.dumps(account_ids(snapshot)), json.dumps(snapshot, default=str), max_modstamp(snapshot), now, now)
+        )
+        conn.commit()
+
+def mark_validated(cache_key: str):
+    """Records a successful SystemModstamp revalidation of one entry: restarts its freshness window."""
+    with connect(SALESFORCE_CACHE_DB) as conn:
+        conn.execute("UPDATE salesforce_snapshots SET validated_at = ? WHERE cache_key = ?", (time.time(), cache_key))
+        conn.commit()
+
+def invalidate(org_or_id: str | None = None) -> int:
+    """Drops one org/account (and every key sharing its account ids), or everything when None."""
+    with connect(SALESFORCE_CACHE_DB) as conn:
+        if org_or_id is None:
+            cur = conn.execute("DELETE FROM salesforce_snapshots")
+            conn.commit()
+            return cur.rowcount
+        key = normalize_key(org_or_id)
+        row = conn.execute("SELECT account_ids FROM salesforce_snapshots WHERE cache_key = ?", (key,)).fetchone()
+        ids = json.loads(row[0]) if row else ([org_or_id.strip()] if _ACCOUNT_ID.fullmatch(org_or_id.strip()) else [])
+        removed = conn.execute("DELETE FROM salesforce_snapshots WHERE cache_key = ?", (key,)).rowcount
+        for account_id in ids:
+            removed += conn.execute(
+                "DELETE FROM salesforce_snapshots WHERE account_ids LIKE ?", (f'%"{account_id}"%',)
+            ).rowcount
+        conn.commit()
+        return removed
@@ -1,43 +1,94 @@
 # salesforce_mcp.py
 import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 from crewai import Agent, Task, Crew, LLM
 from crewai_tools import MCPServerAdapter
 from mcp import StdioServerParameters
+from mcp.shared.exceptions import McpError
+import anyio
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
+from llm_cache import cached_completion
+import salesforce_cache
+from metrics import span
+from token_usage import apply_budget, tracked_kickoff, tracked_call
+
+load_dotenv()
+
+# Use the local stub server (stub_salesforce_mcp.py) instead of the real npx package
+SALESFORCE_MCP_STUB = os.getenv("SALESFORCE_MCP_STUB", "").lower() in ("1", "true", "yes")
+# Resolve orgs with one structured SOQL query instead of the multi-turn agent loop
+SALESFORCE_FAST_PATH = os.getenv("SALESFORCE_FAST_PATH", "true").lower() in ("1", "true", "yes")
+# The fast path prefetches in the background, which only ever uses a spare connection: default to two
+SALESFORCE_MCP_POOL_SIZE = int(os.getenv("SALESFORCE_MCP_POOL_SIZE", "2" if SALESFORCE_FAST_PATH else "1"))
+SALESFORCE_MCP_HEALTH_INTERVAL = float(os.getenv("SALESFORCE_MCP_HEALTH_INTERVAL", "120"))
+
+_llm = None
+_llm_lock = threading.Lock()
 
 # --- Reusable Helper Function for Setup ---
 def _check_env_vars_and_get_llm():
-    """Checks for required environment variables and initializes the LLM."""
+    """Checks for required environment variables and returns the shared LLM (built once)."""
+    global _llm
     required_env_vars = [
         "SALESFORCE_USERNAME", "SALESFORCE_PASSWORD", "SALESFORCE_TOKEN",
         "SALESFORCE_INSTANCE_URL", "GEMINI_API_KEY"
-    ]
+    ] if not SALESFORCE_MCP_STUB else ["GEMINI_API_KEY"]
     missing_vars = [var for var in required_env_vars if not os.getenv(var)]
     if missing_vars:
         error_msg = f"Error: The following environment variables are not set: {', '.join(missing_vars)}"
         print(error_msg)
         raise ValueError(error_msg)
     
-    try:
-        llm = LLM(model="gemini/gemini-1.5-flash", api_key=os.getenv("GEMINI_API_KEY"))
-        return llm
-    except Exception as e:
-        print(f"An unexpected error occurred during LLM initialization: {e}")
-        raise
+    with _llm_lock:
+        if _llm is not None:
+            return _llm
+        try:
+            _llm = LLM(model="gemini/gemini-1.5-flash", api_key=os.getenv("GEMINI_API_KEY"))
+            return _llm
+        except Exception as e:
+            print(f"An unexpected error occurred during LLM initialization: {e}")
+            raise
 
-# --- Function for the Flask App (Non-Interactive) ---
-def fetch_salesforce_data(prompt: str) -> str:
-    """
-    Sets up and runs a NON-INTERACTIVE CrewAI crew to fetch Salesforce data.
-    """
-    print(f"🚀 [Web App] Kicking off Salesforce crew for prompt: {prompt}")
-    try:
-        llm = _check_env_vars_and_get_llm()
-    except (ValueError, Exception) as e:
-        return f"Failed to initialize Salesforce connection: {e}"
+def _build_salesforce_crew(mcp_tools, llm) -> Crew:
+    """Builds the Salesforce crew once per tool session; the prompt is supplied at kickoff."""
+    salesforce_agent = Agent(
+        role="Senior Salesforce Administrator",
+        goal="Your primary goal is to accurately answer the user's request by finding the right information in Salesforce using the available tools.",
+        backstory="You are a meticulous AI-powered Salesforce administrator...",
+        tools=mcp_tools,
+        llm=llm,
+        verbose=True,
+        allow_delegation=False,
+    )
+
+    salesforce_task = Task(
+        description="{prompt}",
+        expected_output="A clear, concise, and accurate summary of the findings from Salesforce.",
+        agent=salesforce_agent,
+        human_input=False,
+    )
+
+    return Crew(
+        agents=[salesforce_agent],
+        tasks=[salesforce_task],
+        verbose=True
+    )
 
-    server_params = StdioServerParameters(
+def _server_params() -> StdioServerParameters:
+    if SALESFORCE_MCP_STUB:
+        stub_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_salesforce_mcp.py")
+        return StdioServerParameters(command=sys.executable, args=[stub_path], env=dict(os.environ))
+    return StdioServerParameters(
         command="npx",
         args=["-y", "@tsmztech/mcp-server-salesforce"],
         env={
@@ -49,45 +100,395 @@ def fetch_salesforce_data(prompt: str) -> str:
         },
     )
 
-    print("Attempting to connect to Salesforce MCP server for web request...")
+
+# --- Long-lived MCP server connections ---
+class _MCPConnection:
+    """One running MCP server process, its tools and the crew built on top of them."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.adapter = None
+        self.tools = None
+        self.crew = None
+        self.healthy = False
+
+    def start(self):
+        self.stop()
+        print(f"Starting Salesforce MCP server #{self.index}...")
+        llm = _check_env_vars_and_get_llm()
+        self.adapter = MCPServerAdapter(_server_params())
+        self.tools = self.adapter.tools
+        self.crew = _build_salesforce_crew(self.tools, llm)
+        self.healthy = True
+        print(f"✅ Salesforce MCP server #{self.index} is up ({len(self.tools)} tools).")
+
+    def stop(self):
+        if self.adapter is not None:
+            try:
+                self.adapter.stop()
+            except Exception as e:
+                print(f"[WARN] Error stopping Salesforce MCP server #{self.index}: {e}")
+        self.adapter, self.tools, self.crew, self.healthy = None, None, None, False
+
+    def tool(self, name: str):
+        return next((t for t in self.tools or [] if t.name == name), None)
+
+    def ping(self) -> bool:
+        """Cheap round trip through the server: list objects matching 'Account'."""
+        if not self.healthy:
+            return False
+        probe = self.tool("salesforce_search_objects")
+        if probe is None:
+            return bool(self.tools)
+        try:
+            probe.run(searchPattern="Account")
+            return True
+        except Exception as e:
+            print(f"[WARN] Salesforce MCP server #{self.index} failed health check: {e}")
+            return False
+
+
+# Errors that mean the server process or its stdio session is gone
+_TRANSPORT_ERRORS = (McpError, anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+                     BrokenPipeError, ConnectionError, EOFError, TimeoutError)
+
+def _connection_lost(conn: _MCPConnection, error: Exception) -> bool:
+    """
+    True if the error came from the MCP transport. Anything else (an LLM error
+    during the crew kickoff, a bad query) leaves the server up unless a ping
+    says otherwise, so it isn't restarted and logged into Salesforce again.
+    """
+    if isinstance(error, _TRANSPORT_ERRORS):
+        return True
+    return not conn.ping()
+
+
+class PoolBusy(RuntimeError):
+    """No spare MCP connection for background work (the last idle one is kept for requests)."""
+
+
+class SalesforceMCPPool:
+    """
+    Keeps SALESFORCE_MCP_POOL_SIZE MCP server processes running for the life of
+    the worker. Requests check a connection out exclusively; a supervisor thread
+    health-checks idle connections and restarts any that fail.
+    """
+
+    def __init__(self, size: int = SALESFORCE_MCP_POOL_SIZE, health_interval: float = SALESFORCE_MCP_HEALTH_INTERVAL):
+        self.connections = [_MCPConnection(i) for i in range(max(1, size))]
+        self.health_interval = health_interval
+        self._idle = queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for conn in self.connections:
+            try:
+                conn.start()
+            except Exception as e:
+                # The supervisor or the next checkout retries it
+                print(f"❌ Could not start Salesforce MCP server #{conn.index}: {e}")
+            self._idle.put(conn)
+        threading.Thread(target=self._supervise, name="salesforce-mcp-supervisor", daemon=True).start()
+
+    def start_async(self):
+        """Starts the servers in the background so app startup isn't blocked by npx."""
+        threading.Thread(target=self.start, name="salesforce-mcp-start", daemon=True).start()
+
+    @contextmanager
+    def connection(self, spare_only: bool = False):
+        """
+        Checks out a connection. spare_only is for background work such as
+        prefetching: it raises PoolBusy instead of taking the last idle one.
+        """
+        self.start()
+        if spare_only:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                raise PoolBusy("no spare Salesforce MCP connection") from None
+            if self._idle.empty():
+                # That was the last idle one: leave it for requests
+                self._idle.put(conn)
+                raise PoolBusy("no spare Salesforce MCP connection")
+        else:
+            conn = self._idle.get()
+        try:
+            if not conn.healthy:
+                conn.start()
+            yield conn
+        except Exception as e:
+            if conn.healthy and _connection_lost(conn, e):
+                print(f"[WARN] Salesforce MCP server #{conn.index} connection lost ({type(e).__name__}); restarting on next use.")
+                conn.healthy = False
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def _supervise(self):
+        while not self._stop_event.wait(self.health_interval):
+            for _ in range(len(self.connections)):
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break  # the rest are busy serving requests
+                try:
+                    if not conn.ping():
+                        conn.start()
+                except Exception as e:
+                    print(f"❌ Restart of Salesforce MCP server #{conn.index} failed: {e}")
+                finally:
+                    self._idle.put(conn)
+
+    def shutdown(self):
+        self._stop_event.set()
+        for conn in self.connections:
+            conn.stop()
+
+mcp_pool = SalesforceMCPPool()
+atexit.register(mcp_pool.shutdown)
+salesforce_cache.init_salesforce_cache()
+
+
+def _result_text(crew_result) -> str:
+    # --- FIX: Make getting the result backward-compatible ---
     try:
-        with MCPServerAdapter(server_params) as mcp_tools:
-            print("Connection successful! Salesforce tools are now available.")
-            
-            salesforce_agent = Agent(
-                role="Senior Salesforce Administrator",
-                goal="Your primary goal is to accurately answer the user's request by finding the right information in Salesforce using the available tools.",
-                backstory="You are a meticulous AI-powered Salesforce administrator...",
-                tools=mcp_tools,
-                llm=llm,
-                verbose=True,
-                allow_delegation=False,
-            )
-
-            salesforce_task = Task(
-                description=prompt,
-                expected_output="A clear, concise, and accurate summary of the findings from Salesforce.",
-                agent=salesforce_agent,
-                human_input=False,
-            )
-
-            salesforce_crew = Crew(
-                agents=[salesforce_agent],
-                tasks=[salesforce_task],
-                verbose=True
-            )
-
-            crew_result = salesforce_crew.kickoff()
+        # In newer versions, the string is in the .raw attribute
+        return crew_result.raw
+    except AttributeError:
+        # In older versions, it might just be the string itself
+        return str(crew_result)
+    # --- END FIX ---
+
+def build_org_prompt(org_name: str) -> str:
+    return (
+        f"The user is asking for information on the organization '{org_name}'. "
+        f"Search Salesforce for all relevant records (like Account, Contacts, and open Opportunities) "
+        f"related to this organization and provide a comprehensive summary of your findings."
+    )
+
+# --- Direct structured query path ---
+ACCOUNT_FIELDS = [
+    "Id", "Name", "Industry", "Website", "BillingCity", "SystemModstamp",
+    "(SELECT Id, Name, Title, Email, SystemModstamp FROM Contacts ORDER BY SystemModstamp DESC LIMIT 25)",
+    "(SELECT Id, Name, StageName, Amount, CloseDate, SystemModstamp FROM Opportunities WHERE IsClosed = false ORDER BY CloseDate LIMIT 25)",
+]
+# Same accounts and child filters as ACCOUNT_FIELDS, ids and SystemModstamps only: enough to
+# see added/removed accounts, contacts and opportunities and edits to any of them
+MODSTAMP_FIELDS = [
+    "Id", "SystemModstamp",
+    "(SELECT Id, SystemModstamp FROM Contacts ORDER BY SystemModstamp DESC LIMIT 25)",
+    "(SELECT Id, SystemModstamp FROM Opportunities WHERE IsClosed = false ORDER BY CloseDate LIMIT 25)",
+]
+_ACCOUNT_ID = re.compile(r"^001[0-9A-Za-z]{12}(?:[0-9A-Za-z]{3})?$")
+
+# Set while prefetching, so background loads only use spare pool connections
+_background = contextvars.ContextVar("salesforce_background", default=False)
+
+def _checkout():
+    return mcp_pool.connection(spare_only=_background.get())
+
+def _soql_literal(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+def _account_where(org_query: str) -> str:
+    q = org_query.strip()
+    if _ACCOUNT_ID.match(q):
+        return f"Id = '{q}'"
+    like = _soql_literal(q).replace("%", "\\%").replace("_", "\\_")
+    return f"Name LIKE '%{like}%'"
+
+def _parse_tool_output(raw) -> dict:
+    text = raw if isinstance(raw, str) else str(raw)
+    try:
+        data = json.loads(text)
+        return data if isinstance(data, dict) else {"records": data}
+    except (ValueError, TypeError):
+        # The npx server formats results as text; hand that to the summarizer as-is
+        return {"raw": text}
+
+_NO_RECORDS = re.compile(r"\b(?:returned|found)\s+0\s+records?\b|\bno (?:matching )?records\b|\btotalSize\"?\s*[:=]\s*0\b", re.I)
+
+def _has_records(data: dict) -> bool:
+    """
+    Whether a parsed tool result matched anything. Text results from the npx
+    server ("Query returned 0 records") count only if they carry an account Id.
+    """
+    if "raw" not in data:
+        return bool(data.get("records"))
+    text = data["raw"]
+    return not _NO_RECORDS.search(text) and bool(salesforce_cache.account_ids(data))
+
+def query_salesforce_snapshot(org_query: str) -> dict | None:
+    """
+    Resolves an organization (account id or name) with ONE query returning the
+    matching accounts together with their contacts and open opportunities.
+    Returns None when nothing matches.
+    """
+    with _checkout() as conn:
+        tool = conn.tool("salesforce_query_records")
+        if tool is None:
+            raise RuntimeError("Salesforce MCP server does not expose salesforce_query_records.")
+        raw = tool.run(objectName="Account", fields=ACCOUNT_FIELDS, whereClause=_account_where(org_query), limit=5)
+    data = _parse_tool_output(raw)
+    if not _has_records(data):
+        return None
+    return {"query": org_query, "fetched_at": time.time(), **data}
+
+def _is_unchanged(org_query: str, entry: dict) -> bool:
+    """
+    Revalidates a stale snapshot without refetching everything: re-runs the org
+    match with ids and SystemModstamps only, and compares the set of account,
+    contact and opportunity ids and the latest SystemModstamp with the cache.
+    """
+    if not entry["account_ids"] or not entry["max_modstamp"]:
+        return False
+    with _checkout() as conn:
+        tool = conn.tool("salesforce_query_records")
+        raw = tool.run(objectName="Account", fields=MODSTAMP_FIELDS, whereClause=_account_where(org_query), limit=5)
+    current = _parse_tool_output(raw)
+    if not _has_records(current):
+        return False
+    cached = entry["snapshot"]
+    return (salesforce_cache.record_ids(current) == salesforce_cache.record_ids(cached)
+            and salesforce_cache.max_modstamp(current) == salesforce_cache.max_modstamp(cached))
+
+def _load_snapshot(org_query: str) -> dict | None:
+    """
+    query_salesforce_snapshot behind the persistent Salesforce cache: fresh entries
+    are served as-is, stale ones are revalidated by SystemModstamp, and only
+    changed or unknown orgs are queried in full.
+    """
+    entry = salesforce_cache.get_entry(org_query)
+    if entry and entry["fresh"]:
+        print(f"[INFO] Salesforce cache hit for '{org_query}'.")
+        return entry["snapshot"]
+    if entry and entry["expired"]:
+        print(f"[INFO] Salesforce cache for '{org_query}' is past its maximum age; refetching.")
+    elif entry:
+        try:
+            with span("salesforce_query", kind="revalidate"):
+                unchanged = _is_unchanged(org_query, entry)
+            if unchanged:
+                print(f"[INFO] Salesforce cache revalidated for '{org_query}' (no changes).")
+                salesforce_cache.mark_validated(entry["key"])
+                return entry["snapshot"]
+        except Exception as e:
+            print(f"[WARN] Salesforce revalidation failed for '{org_query}': {e}")
+    with span("salesforce_query", kind="snapshot"):
+        snapshot = query_salesforce_snapshot(org_query)
+    if snapshot:
+        salesforce_cache.put_snapshot(org_query, snapshot)
+    return snapshot
+
+# In-flight snapshot loads, so a request arriving while a prefetch runs joins it
+_inflight = {}
+_inflight_lock = threading.Lock()
+_prefetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SALESFORCE_PREFETCH_WORKERS", "2")))
+
+def get_salesforce_snapshot(org_query: str) -> dict | None:
+    """Single-flight wrapper around _load_snapshot: one Salesforce fetch per org at a time."""
+    key = salesforce_cache.normalize_key(org_query)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        print(f"[INFO] Joining in-flight Salesforce fetch for '{org_query}'.")
+        try:
+            return future.result()
+        except PoolBusy:
+            # The prefetch we joined gave way to requests; load it ourselves
+            return _load_snapshot(org_query)
+    try:
+        snapshot = _load_snapshot(org_query)
+        future.set_result(snapshot)
+        return snapshot
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def _prefetch(org_query: str):
+    token = _background.set(True)
+    try:
+        get_salesforce_snapshot(org_query)
+        print(f"✅ Salesforce data prefetched for '{org_query}'.")
+    except PoolBusy:
+        print(f"[INFO] Salesforce prefetch for '{org_query}' skipped: no spare MCP connection.")
+    except Exception as e:
+        print(f"[WARN] Salesforce prefetch failed for '{org_query}': {e}")
+    finally:
+        _background.reset(token)
+
+def prefetch_salesforce_snapshot(org_query: str):
+    """Starts resolving the org in the background so it's cached before the rep asks."""
+    if not SALESFORCE_FAST_PATH or not (org_query or "").strip():
+        return
+    print(f"[INFO] Prefetching Salesforce data for '{org_query}'.")
+    _prefetch_executor.submit(_prefetch, org_query.strip())
+
+def summarize_salesforce_snapshot(org_query: str, snapshot: dict) -> str:
+    """Single LLM call that turns the structured records into the rep-facing summary."""
+    llm = _check_env_vars_and_get_llm()
+    records = {k: v for k, v in snapshot.items() if k not in ("fetched_at",)}
+    prompt = (
+        f"Salesforce records for the organization '{org_query}' (accounts with their contacts and open opportunities):\n"
+        f"{json.dumps(records, indent=1, default=str)}\n\n"
+        "Write a clear, concise, and accurate summary of these findings for a sales rep: the account(s), "
+        "key contacts and their titles, and open opportunities with stage, amount and close date. "
+        "Use only the records above."
+    )
+    prompt = apply_budget(prompt, "salesforce_summary")
+    messages = [
+        {"role": "system", "content": "You are a meticulous Salesforce administrator summarizing CRM records."},
+        {"role": "user", "content": prompt},
+    ]
+    def _call():
+        with span("llm_call", agent="salesforce_summary", mode="direct"):
+            return tracked_call(llm, messages, "salesforce_summary").strip()
+    return cached_completion("salesforce_summary", llm.model, prompt, _call)
+
+def get_salesforce_insights(org_query: str) -> str:
+    """
+    Fast path: one structured query plus one summary call. Falls back to the
+    agent crew when the fast path is off, finds nothing, or fails.
+    """
+    if SALESFORCE_FAST_PATH:
+        try:
+            snapshot = get_salesforce_snapshot(org_query)
+            if snapshot:
+                return summarize_salesforce_snapshot(org_query, snapshot)
+            print(f"[INFO] No Salesforce account matched '{org_query}'. Falling back to the agent.")
+        except Exception as e:
+            print(f"[WARN] Salesforce fast path failed, falling back to the agent: {e}")
+    return fetch_salesforce_data(build_org_prompt(org_query))
+
+# --- Function for the Flask App (Non-Interactive) ---
+def fetch_salesforce_data(prompt: str) -> str:
+    """
+    Runs the NON-INTERACTIVE Salesforce crew on a pooled, already-running MCP server.
+    """
+    print(f"🚀 [Web App] Kicking off Salesforce crew for prompt: {prompt}")
+    try:
+        _check_env_vars_and_get_llm()
+    except (ValueError, Exception) as e:
+        return f"Failed to initialize Salesforce connection: {e}"
+
+    try:
+        with mcp_pool.connection() as conn:
+            with span("llm_call", agent="salesforce_crew", mode="crew"):
+                crew_result = tracked_kickoff(conn.crew, "salesforce_crew", prompt, inputs={"prompt": prompt})
             print("✅ [Web App] Crew finished successfully.")
-            
-            # --- FIX: Make getting the result backward-compatible ---
-            try:
-                # In newer versions, the string is in the .raw attribute
-                return crew_result.raw
-            except AttributeError:
-                # In older versions, it might just be the string itself
-                return str(crew_result)
-            # --- END FIX ---
+            return _result_text(crew_result)
 
     except Exception as e:
         error_message = f"An error occurred during Salesforce crew execution: {e}"
@@ -95,7 +496,6 @@ def fetch_salesforce_data(prompt: str) -> str:
         return error_message
 
 # --- Local Flask App for Testing ---
-load_dotenv()
 app = Flask(__name__)
 
 @app.route("/test_salesforce", methods=["GET"])
@@ -108,13 +508,9 @@ def test_salesforce_route():
         }), 400
 
     # --- FIX: Using a better, more reliable prompt ---
-    prompt = (
-        f"The user is asking for information on the organization '{org_name}'. "
-        f"Search Salesforce for all relevant records (like Account, Contacts, and open Opportunities) "
-        f"related to this organization and provide a comprehensive summary of your findings."
-    )
-    
-    result = fetch_salesforce_data(prompt)
+    prompt = build_org_prompt(org_name)
+
+    result = get_salesforce_insights(org_name)
     
     return jsonify({
         "organization_queried": org_name,
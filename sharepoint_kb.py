@@ -1,5 +1,7 @@
 #sharepoint_kb.py
 import os
+import re
+import hashlib
 import requests
 import sqlite3
 from datetime import datetime
@@ -8,6 +10,9 @@ from dotenv import load_dotenv
 import fitz  # PyMuPDF
 from docx import Document
 from pptx import Presentation
+from metrics import span
+from storage import connect, apply_migrations, DB_PATH
+from storage import compression_codec, compress_text, decompress_text, train_dictionary, vacuum_if_sparse
 
 load_dotenv()
 
@@ -23,7 +28,7 @@ SITE_PATHS = [p.strip().strip("'\"") for p in raw_paths.split(',') if p.strip()]
 AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
 SCOPE = ["https://graph.microsoft.com/.default"]
 GRAPH_API = "https://graph.microsoft.com/v1.0"
-DB_FILE = "kb_cache.db" # Database file configuration
+DB_FILE = DB_PATH  # Database file configuration (KB_CACHE_DB)
 
 # === Ensure required folders exist ===
 os.makedirs("tmp/sharepoint_docs", exist_ok=True)
@@ -31,54 +36,269 @@ os.makedirs("kb", exist_ok=True)
 
 
 # === MODIFICATION START: Database functions moved here ===
+# Every refresh is stored as a new numbered version; kb_state.active_version says
+# which one is served, so workers can cheaply check for a refresh and admins can roll back.
+KB_KEEP_VERSIONS = int(os.getenv("KB_KEEP_VERSIONS", "10"))
+# Version content is stored as compressed chunks (one per document, split further
+# above KB_CHUNK_CHARS); KB_COMPRESSION_DICT adds a dictionary shared by the chunks.
+KB_CHUNK_CHARS = int(os.getenv("KB_CHUNK_CHARS", "65536"))
+KB_COMPRESSION_DICT = os.getenv("KB_COMPRESSION_DICT", "false").lower() in ("1", "true", "yes")
+_DOCUMENT_START = re.compile(r"^# Document: (.+)$", re.M)
+_dict_cache = {}
+
+def _import_legacy_kb(conn):
+    """The single-entry knowledge_base content becomes version 1."""
+    if not conn.execute("SELECT 1 FROM kb_versions LIMIT 1").fetchone():
+        row = conn.execute("SELECT content FROM knowledge_base ORDER BY last_updated DESC LIMIT 1").fetchone()
+        if row:
+            conn.execute("INSERT INTO kb_versions (content, fingerprint, created) VALUES (?, ?, ?)",
+                         (row[0], _fingerprint(row[0]), datetime.now()))
+            conn.execute("INSERT OR REPLACE INTO kb_state (id, active_version, changed) VALUES (1, ?, ?)",
+                         (conn.execute("SELECT last_insert_rowid()").fetchone()[0], datetime.now()))
+
+def _chunk_existing_versions(conn):
+    """Moves plain-text version content into compressed chunks and empties the old column."""
+    for version, content in conn.execute("SELECT version, content FROM kb_versions WHERE chunked = 0").fetchall():
+        _write_chunks(conn.cursor(), version, content)
+        conn.execute("UPDATE kb_versions SET content = '', chunked = 1 WHERE version = ?", (version,))
+
+KB_MIGRATIONS = [
+    # 1: the original single-entry table
+    """
+        CREATE TABLE IF NOT EXISTS knowledge_base (
+            id INTEGER PRIMARY KEY,
+            content TEXT NOT NULL,
+            last_updated TIMESTAMP NOT NULL
+        )
+    """,
+    # 2: numbered versions with an active pointer
+    """
+        CREATE TABLE IF NOT EXISTS kb_versions (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            created TIMESTAMP NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS kb_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            active_version INTEGER NOT NULL,
+            changed TIMESTAMP NOT NULL
+        )
+    """,
+    _import_legacy_kb,
+    # 4: compressed per-document chunks, optionally sharing a dictionary
+    """
+        CREATE TABLE IF NOT EXISTS kb_dicts (
+            dict_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created TIMESTAMP NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS kb_chunks (
+            version INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            dict_id INTEGER,
+            raw_chars INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (version, seq)
+        );
+        ALTER TABLE kb_versions ADD COLUMN chunked INTEGER NOT NULL DEFAULT 0
+    """,
+    _chunk_existing_versions,
+    # 6: the legacy row was imported as version 1 (migration 3); drop the uncompressed copy
+    "DELETE FROM knowledge_base",
+]
+
 def init_db():
-    """Initializes the database and creates the table if it doesn't exist."""
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        # Create table to store the entire KB content as a single entry
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS knowledge_base (
-                id INTEGER PRIMARY KEY,
-                content TEXT NOT NULL,
-                last_updated TIMESTAMP NOT NULL
-            )
-        """)
-        conn.commit()
+    """Initializes the database and brings the KB tables up to date."""
+    apply_migrations("knowledge_base", KB_MIGRATIONS, DB_FILE)
+    # Migrations 5 and 6 free most of a legacy database's pages; give them back to the filesystem
+    vacuum_if_sparse(DB_FILE)
+
+def _fingerprint(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+def split_kb_chunks(content: str) -> list:
+    """(name, text) per document, split at line breaks above KB_CHUNK_CHARS; joining the texts gives content back."""
+    starts = [0] + [m.start() for m in _DOCUMENT_START.finditer(content) if m.start() > 0]
+    chunks = []
+    for begin, end in zip(starts, starts[1:] + [len(content)]):
+        doc = content[begin:end]
+        match = _DOCUMENT_START.match(doc)
+        name = match.group(1).strip() if match else ""
+        while len(doc) > KB_CHUNK_CHARS:
+            cut = doc.rfind("\n", 0, KB_CHUNK_CHARS) + 1 or KB_CHUNK_CHARS
+            chunks.append((name, doc[:cut]))
+            doc = doc[cut:]
+        if doc:
+            chunks.append((name, doc))
+    return chunks
+
+def _load_dict(cursor, dict_id: int) -> bytes:
+    if dict_id not in _dict_cache:
+        _dict_cache[dict_id] = cursor.execute("SELECT data FROM kb_dicts WHERE dict_id = ?", (dict_id,)).fetchone()[0]
+    return _dict_cache[dict_id]
+
+def _write_chunks(cursor, version: int, content: str):
+    codec = compression_codec()
+    chunks = split_kb_chunks(content)
+    dict_id, zdict = None, None
+    if KB_COMPRESSION_DICT and codec != "none":
+        zdict = train_dictionary([text for _, text in chunks], codec)
+        if zdict:
+            cursor.execute("INSERT INTO kb_dicts (codec, data, created) VALUES (?, ?, ?)", (codec, zdict, datetime.now()))
+            dict_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO kb_chunks (version, seq, name, codec, dict_id, raw_chars, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(version, seq, name, codec, dict_id, len(text), compress_text(text, codec, zdict))
+         for seq, (name, text) in enumerate(chunks)]
+    )
+
+def _read_chunks(cursor, version: int) -> list:
+    rows = cursor.execute(
+        "SELECT name, codec, dict_id, data FROM kb_chunks WHERE version = ? ORDER BY seq", (version,)
+    ).fetchall()
+    return [(name, decompress_text(data, codec, _load_dict(cursor, dict_id) if dict_id else None))
+            for name, codec, dict_id, data in rows]
 
-def update_kb_in_db(content: str):
+def _version_content(cursor, version: int, chunked: int, content: str) -> str:
+    return "".join(text for _, text in _read_chunks(cursor, version)) if chunked else content
+
+def _insert_version(cursor, content: str, activate: bool = True) -> int:
+    cursor.execute(
+        "INSERT INTO kb_versions (content, fingerprint, created, chunked) VALUES ('', ?, ?, 1)",
+        (_fingerprint(content), datetime.now())
+    )
+    version = cursor.lastrowid
+    _write_chunks(cursor, version, content)
+    if activate:
+        cursor.execute(
+            "INSERT OR REPLACE INTO kb_state (id, active_version, changed) VALUES (1, ?, ?)",
+            (version, datetime.now())
+        )
+    return version
+
+def update_kb_in_db(content: str, activate: bool = True) -> int:
     """
-    Updates the knowledge base content in the database.
-    This function will replace the old KB with the new content.
+    Stores the content as a new KB version and makes it the active one, in one
+    transaction. Returns the active version (unchanged if the content is identical).
+    With activate=False the version is only stored; activate it with activate_kb_version
+    once whatever depends on it (e.g. the KB digest) is ready.
     """
-    with sqlite3.connect(DB_FILE) as conn:
+    with connect(DB_FILE) as conn:
         cursor = conn.cursor()
-        # Remove the old entry
-        cursor.execute("DELETE FROM knowledge_base")
-        # Insert the new entry with the current timestamp
+        cursor.execute("BEGIN IMMEDIATE")
+        active = cursor.execute("""
+            SELECT v.version, v.fingerprint FROM kb_state s JOIN kb_versions v ON v.version = s.active_version
+        """).fetchone()
+        if active and active[1] == _fingerprint(content):
+            conn.commit()
+            print(f"✅ KB content unchanged; version {active[0]} stays active.")
+            return active[0]
+        if not activate:
+            stored = cursor.execute(
+                "SELECT MAX(version) FROM kb_versions WHERE fingerprint = ?", (_fingerprint(content),)
+            ).fetchone()[0]
+            if stored is not None:
+                conn.commit()
+                return stored
+        version = _insert_version(cursor, content, activate)
+        # Keep the newest KB_KEEP_VERSIONS versions for rollback, and always the active one
+        cursor.execute("""
+            DELETE FROM kb_versions WHERE version NOT IN (
+                SELECT version FROM kb_versions ORDER BY version DESC LIMIT ?
+            ) AND version IS NOT (SELECT active_version FROM kb_state WHERE id = 1)
+        """, (KB_KEEP_VERSIONS,))
+        cursor.execute("DELETE FROM kb_chunks WHERE version NOT IN (SELECT version FROM kb_versions)")
+        cursor.execute("DELETE FROM kb_dicts WHERE dict_id NOT IN (SELECT dict_id FROM kb_chunks WHERE dict_id IS NOT NULL)")
+        conn.commit()
+        print(f"✅ Database cache has been updated (KB version {version}).")
+        return version
+
+def get_active_kb_version() -> int | None:
+    """Single-row read used by workers to detect a refresh made elsewhere."""
+    with connect(DB_FILE) as conn:
+        row = conn.execute("SELECT active_version FROM kb_state WHERE id = 1").fetchone()
+    return row[0] if row else None
+
+def get_active_kb() -> dict | None:
+    """The active version as {"version", "content", "fingerprint"}, or None."""
+    with connect(DB_FILE) as conn:
+        row = conn.execute("""
+            SELECT v.version, v.content, v.fingerprint, v.chunked FROM kb_state s JOIN kb_versions v ON v.version = s.active_version
+        """).fetchone()
+        if not row:
+            return None
+        content = _version_content(conn.cursor(), row[0], row[3], row[1])
+    return {"version": row[0], "content": content, "fingerprint": row[2]}
+
+def list_kb_versions() -> list:
+    with connect(DB_FILE) as conn:
+        active = conn.execute("SELECT active_version FROM kb_state WHERE id = 1").fetchone()
+        rows = conn.execute("""
+            SELECT v.version, v.fingerprint, v.created,
+                   COALESCE(SUM(c.raw_chars), LENGTH(v.content)), COALESCE(SUM(LENGTH(c.data)), LENGTH(v.content)), COUNT(c.seq)
+            FROM kb_versions v LEFT JOIN kb_chunks c ON c.version = v.version
+            GROUP BY v.version ORDER BY v.version DESC
+        """).fetchall()
+    return [{"version": r[0], "fingerprint": r[1], "created": r[2], "chars": r[3], "stored_bytes": r[4],
+             "chunks": r[5], "active": bool(active and active[0] == r[0])} for r in rows]
+
+def previous_kb_version() -> int | None:
+    """The newest stored version older than the active one (the default rollback target)."""
+    with connect(DB_FILE) as conn:
+        row = conn.execute("""
+            SELECT MAX(version) FROM kb_versions WHERE version < (SELECT active_version FROM kb_state WHERE id = 1)
+        """).fetchone()
+    return row[0] if row else None
+
+def get_kb_version(version: int) -> dict | None:
+    """A stored version as {"version", "content", "fingerprint"}, active or not."""
+    with connect(DB_FILE) as conn:
+        row = conn.execute(
+            "SELECT version, content, fingerprint, chunked FROM kb_versions WHERE version = ?", (version,)
+        ).fetchone()
+        if not row:
+            return None
+        content = _version_content(conn.cursor(), row[0], row[3], row[1])
+    return {"version": row[0], "content": content, "fingerprint": row[2]}
+
+def activate_kb_version(version: int = None) -> int:
+    """Makes a stored version active again; defaults to the one before the active version."""
+    with connect(DB_FILE) as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        if version is None:
+            row = cursor.execute("""
+                SELECT MAX(version) FROM kb_versions WHERE version < (SELECT active_version FROM kb_state WHERE id = 1)
+            """).fetchone()
+            version = row[0] if row else None
+            if version is None:
+                raise ValueError("There is no earlier KB version to roll back to.")
+        elif not cursor.execute("SELECT 1 FROM kb_versions WHERE version = ?", (version,)).fetchone():
+            raise ValueError(f"KB version {version} is not stored.")
         cursor.execute(
-            "INSERT INTO knowledge_base (content, last_updated) VALUES (?, ?)",
-            (content, datetime.now())
+            "INSERT OR REPLACE INTO kb_state (id, active_version, changed) VALUES (1, ?, ?)",
+            (version, datetime.now())
         )
         conn.commit()
-        print("✅ Database cache has been updated.")
+    print(f"✅ KB version {version} is now active.")
+    return version
 
 def get_kb_from_db() -> str | None:
     """
-    Retrieves the knowledge base content from the database.
+    Retrieves the active knowledge base version from the database.
     Returns the content as a string, or None if the cache is empty.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            # Get the most recent entry
-            cursor.execute("SELECT content FROM knowledge_base ORDER BY last_updated DESC LIMIT 1")
-            row = cursor.fetchone()
-            if row:
-                print("✅ KB content retrieved from database cache.")
-                return row[0]
-            else:
-                print("🟡 Database cache is empty.")
-                return None
+        kb = get_active_kb()
+        if kb:
+            print(f"✅ KB content (version {kb['version']}) retrieved from database cache.")
+            return kb["content"]
+        print("🟡 Database cache is empty.")
+        return None
     except sqlite3.OperationalError:
         # This can happen if the table doesn't exist yet
         print("🟡 Database table not found. It will be created.")
@@ -134,7 +354,8 @@ def traverse_folder(site_id, item_id, headers, level=0, max_depth=2):
 
     combined = ""
     children_url = f"{GRAPH_API}/sites/{site_id}/drive/items/{item_id}/children"
-    res = requests.get(children_url, headers=headers)
+    with span("graph_call", op="list_children"):
+        res = requests.get(children_url, headers=headers)
 
     if res.status_code != 200:
         print(f"⚠️ Failed to list children: {res.text}")
@@ -150,7 +371,8 @@ def traverse_folder(site_id, item_id, headers, level=0, max_depth=2):
             if ext in [".pdf", ".docx", ".pptx", ".txt"]:
                 print(f"📁📁📁 Downloading: {name}")
                 dl_url = f"{GRAPH_API}/sites/{site_id}/drive/items/{file_id}/content"
-                res_file = requests.get(dl_url, headers=headers)
+                with span("graph_call", op="download"):
+                    res_file = requests.get(dl_url, headers=headers)
 
                 if res_file.status_code == 200:
                     local_path = os.path.join("tmp/sharepoint_docs", f"{site_id}_{name}")
@@ -158,16 +380,17 @@ def traverse_folder(site_id, item_id, headers, level=0, max_depth=2):
                         f.write(res_file.content)
 
                     # Extract content
-                    if ext == ".pdf":
-                        extracted = extract_text_from_pdf(local_path)
-                    elif ext == ".docx":
-                        extracted = extract_text_from_docx(local_path)
-                    elif ext == ".pptx":
-                        extracted = extract_text_from_pptx(local_path)
-                    elif ext == ".txt":
-                        extracted = extract_text_from_txt(local_path)
-                    else:
-                        extracted = ""
+                    with span("extraction", kind=ext.lstrip(".")):
+                        if ext == ".pdf":
+                            extracted = extract_text_from_pdf(local_path)
+                        elif ext == ".docx":
+                            extracted = extract_text_from_docx(local_path)
+                        elif ext == ".pptx":
+                            extracted = extract_text_from_pptx(local_path)
+                        elif ext == ".txt":
+                            extracted = extract_text_from_txt(local_path)
+                        else:
+                            extracted = ""
 
                     if extracted.strip():
                         print(f"✅ Extracted from: {name}")
@@ -191,7 +414,8 @@ def get_sharepoint_kb():
         authority=AUTHORITY,
         client_credential=CLIENT_SECRET
     )
-    token_response = app.acquire_token_for_client(scopes=SCOPE)
+    with span("graph_call", op="token"):
+        token_response = app.acquire_token_for_client(scopes=SCOPE)
 
     if "access_token" not in token_response:
         print("❌ SP Authentication failed.")
@@ -210,7 +434,8 @@ def get_sharepoint_kb():
         path = path.strip()
         print(f"\n🔍 Processing site path: {path}")
         site_url = f"{GRAPH_API}/sites/{SITE_DOMAIN}:{path}"
-        res = requests.get(site_url, headers=headers)
+        with span("graph_call", op="site"):
+            res = requests.get(site_url, headers=headers)
 
         if res.status_code != 200:
             print(f"❌ Site not found for path: {path}")
@@ -222,7 +447,8 @@ def get_sharepoint_kb():
 
         # Root folder
         root_items_url = f"{GRAPH_API}/sites/{site_id}/drive/root/children"
-        root_res = requests.get(root_items_url, headers=headers)
+        with span("graph_call", op="list_children"):
+            root_res = requests.get(root_items_url, headers=headers)
 
         if root_res.status_code != 200:
             print(f"❌ Could not list root drive contents for {path}")
@@ -0,0 +1,219 @@
+#storage.py
+"""
+Shared SQLite access for kb_cache.db and the caches that live in it.
+
+The runtime database lives under data/ (APP_DATA_DIR), which is not tracked.
+The kb_cache.db shipped at the repo root is only a seed: when the runtime
+database doesn't exist yet it starts as a copy of the seed, which is opened
+read-only and never modified.
+
+connect() returns a connection cached per thread (and per process, so forked
+gunicorn workers never share one), in WAL mode so KB refreshes and cache writes
+don't block readers, with the pragmas below. apply_migrations() versions each
+component's schema in a schema_version table, so later changes run exactly once
+per database.
+
+Use it like sqlite3.connect: `with connect(path) as conn:` commits (or rolls
+back) the transaction but keeps the connection open for reuse.
+"""
+import os
+import zlib
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is used instead
+    zstandard = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.abspath(os.getenv("APP_DATA_DIR", os.path.join(APP_DIR, "data")))
+# Relative paths are resolved once, at import, so a later chdir doesn't move the database
+DB_PATH = os.path.abspath(os.getenv("KB_CACHE_DB", os.path.join(DATA_DIR, "kb_cache.db")))
+KB_SEED_DB = os.path.abspath(os.getenv("KB_SEED_DB", os.path.join(APP_DIR, "kb_cache.db")))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()  # NORMAL is safe with WAL
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() in ("1", "true", "yes")
+
+_local = threading.local()
+_migrate_lock = threading.Lock()
+
+
+def resolve(path: str = None) -> str:
+    return os.path.abspath(path) if path else DB_PATH
+
+def _seed(path: str):
+    """Creates the runtime database as a copy of KB_SEED_DB (read-only), if there is one."""
+    if path != DB_PATH or path == KB_SEED_DB or os.path.exists(path) or not os.path.exists(KB_SEED_DB):
+        return
+    tmp = f"{path}.seed-{os.getpid()}-{threading.get_ident()}"
+    source = sqlite3.connect(f"file:{KB_SEED_DB}?mode=ro", uri=True)
+    try:
+        target = sqlite3.connect(tmp)
+        with target:
+            source.backup(target)
+        target.close()
+        # link() fails if another worker created the database first; theirs wins
+        os.link(tmp, path)
+        print(f"[INFO] Created {path} from the seed database {KB_SEED_DB}.")
+    except FileExistsError:
+        pass
+    finally:
+        source.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _open(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _seed(path)
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    if SQLITE_WAL:
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """This thread's connection to the database at path (default: DB_PATH)."""
+    path = resolve(path)
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        # First use in this thread, or we're in a forked child: don't reuse the parent's handles
+        _local.pid, _local.conns = pid, {}
+    conn = _local.conns.get(path)
+    if conn is None:
+        conn = _local.conns[path] = _open(path)
+    return conn
+
+def close_all():
+    """Closes this thread's connections (e.g. at the end of a worker thread)."""
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+
+
+def apply_migrations(component: str, steps: list, path: str = None) -> int:
+    """
+    Brings one component's schema up to date. steps[i] is migration i+1: an SQL
+    script or a callable taking the connection. Only steps above the recorded
+    version run, each in its own transaction. Returns the resulting version.
+    """
+    conn = connect(path)
+    with _migrate_lock:
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    component TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    applied TIMESTAMP NOT NULL
+                )
+            """)
+        row = conn.execute("SELECT version FROM schema_version WHERE component = ?", (component,)).fetchone()
+        current = row[0] if row else 0
+        for version, step in enumerate(steps[current:], start=current + 1):
+            # BEGIN IMMEDIATE so two workers starting together don't both run a step
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT version FROM schema_version WHERE component = ?", (component,)).fetchone()
+                if row and row[0] >= version:
+                    conn.rollback()
+                    continue
+                if callable(step):
+                    step(conn)
+                else:
+                    for statement in filter(str.strip, step.split(";")):
+                        conn.execute(statement)
+                conn.execute(
+                    "INSERT OR REPLACE INTO schema_version (component, version, applied) VALUES (?, ?, ?)",
+                    (component, version, datetime.now())
+                )
+                conn.commit()
+                print(f"[INFO] Applied {component} schema migration {version}.")
+            except Exception:
+                conn.rollback()
+                raise
+        return max(current, len(steps))
+
+def vacuum_if_sparse(path: str = None, min_free_ratio: float = 0.25) -> bool:
+    """
+    VACUUMs the database when at least min_free_ratio of its pages are free
+    (e.g. after a migration moved or deleted large rows). Returns True if it ran.
+    """
+    conn = connect(path)
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not pages or free / pages < min_free_ratio:
+        return False
+    try:
+        conn.execute("VACUUM")
+        if SQLITE_WAL:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.OperationalError as e:
+        # Another worker is using the database; the next start tries again
+        print(f"[WARN] VACUUM of {resolve(path)} skipped: {e}")
+        return False
+    print(f"[INFO] Vacuumed {resolve(path)}: released {free} of {pages} pages.")
+    return True
+
+
+# --- Compressed text blobs ---
+# codec is stored next to each blob ("zlib", "zstd" or "none"), so data written with
+# one setting stays readable after STORAGE_COMPRESSION changes.
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "zlib").lower()
+STORAGE_COMPRESSION_LEVEL = int(os.getenv("STORAGE_COMPRESSION_LEVEL", "6"))
+ZLIB_DICT_MAX = 32 * 1024  # zlib only looks back 32 KB, so a larger dictionary is wasted
+
+def compression_codec() -> str:
+    if STORAGE_COMPRESSION == "zstd" and zstandard is None:
+        print("[WARN] STORAGE_COMPRESSION=zstd needs 'pip install zstandard'; using zlib.")
+        return "zlib"
+    return STORAGE_COMPRESSION if STORAGE_COMPRESSION in ("zlib", "zstd", "none") else "zlib"
+
+def compress_text(text: str, codec: str, zdict: bytes = None) -> bytes:
+    data = text.encode("utf-8")
+    if codec == "zstd":
+        params = {"level": STORAGE_COMPRESSION_LEVEL}
+        if zdict:
+            params["dict_data"] = zstandard.ZstdCompressionDict(zdict)
+        return zstandard.ZstdCompressor(**params).compress(data)
+    if codec == "zlib":
+        compressor = zlib.compressobj(STORAGE_COMPRESSION_LEVEL, zdict=zdict) if zdict else zlib.compressobj(STORAGE_COMPRESSION_LEVEL)
+        return compressor.compress(data) + compressor.flush()
+    return data
+
+def decompress_text(blob: bytes, codec: str, zdict: bytes = None) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This data is zstd-compressed; install zstandard to read it.")
+        params = {"dict_data": zstandard.ZstdCompressionDict(zdict)} if zdict else {}
+        return zstandard.ZstdDecompressor(**params).decompress(blob).decode("utf-8")
+    if codec == "zlib":
+        decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
+    return bytes(blob).decode("utf-8")
+
+def train_dictionary(samples: list, codec: str, size: int = 16 * 1024) -> bytes | None:
+    """
+    A shared dictionary for compressing many similar small texts. zstd trains one;
+    for zlib it is the lines repeated across samples (headers, boilerplate), most
+    frequent last since zlib favours recent dictionary bytes.
+    """
+    encoded = [s.encode("utf-8") for s in samples if s]
+    if len(encoded) < 2:
+        return None
+    if codec == "zstd":
+        try:
+            return zstandard.train_dictionary(size, encoded).as_bytes()
+        except zstandard.ZstdError:
+            pass  # too few samples to train on; use repeated lines like zlib
+    counts = Counter(line for s in encoded for line in set(s.splitlines(keepends=True)) if len(line) > 8)
+    repeated = [line for line, n in sorted(counts.items(), key=lambda kv: kv[1]) if n > 1]
+    zdict = b"".join(repeated)[-min(size, ZLIB_DICT_MAX):]
+    return zdict or None
@@ -0,0 +1,144 @@
+#stub_salesforce_mcp.py
+"""
+Local stand-in for @tsmztech/mcp-server-salesforce, for tests and benchmarks.
+Serves canned Account/Contact/Opportunity records over MCP stdio with the same
+tool names the real server exposes. Point the app at it with SALESFORCE_MCP_STUB=1.
+Set SALESFORCE_STUB_DATA to a JSON file ({"Account": [...], "Contact": [...], ...})
+to replace the built-in records.
+"""
+import os
+import re
+import json
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("salesforce-stub")
+
+DEFAULT_DATA = {
+    "Account": [
+        {"Id": "001Dn000001FsrvIAC", "Name": "Fiserv", "Industry": "Financial Services", "Website": "fiserv.com",
+         "BillingCity": "Brookfield", "OwnerName": "Priya Raman", "SystemModstamp": "2025-06-10T09:30:00.000+0000"},
+        {"Id": "001Dn000001HndaIAC", "Name": "American Honda Motor Co.", "Industry": "Automotive", "Website": "honda.com",
+         "BillingCity": "Torrance", "OwnerName": "Mark Ellis", "SystemModstamp": "2025-05-28T16:02:00.000+0000"},
+    ],
+    "Contact": [
+        {"Id": "003Dn000002DwhiIAA", "AccountId": "001Dn000001FsrvIAC", "Name": "Dana Whitfield", "Title": "VP Engineering",
+         "Email": "dana.whitfield@example.com", "SystemModstamp": "2025-06-01T10:00:00.000+0000"},
+        {"Id": "003Dn000002LortIAA", "AccountId": "001Dn000001FsrvIAC", "Name": "Luis Ortega", "Title": "Director, DevOps",
+         "Email": "luis.ortega@example.com", "SystemModstamp": "2025-04-12T08:15:00.000+0000"},
+        {"Id": "003Dn000002KtanIAA", "AccountId": "001Dn000001HndaIAC", "Name": "Keiko Tanaka", "Title": "IT Program Manager",
+         "Email": "keiko.tanaka@example.com", "SystemModstamp": "2025-05-20T13:45:00.000+0000"},
+    ],
+    "Opportunity": [
+        {"Id": "006Dn000000ApiMIAS", "AccountId": "001Dn000001FsrvIAC", "Name": "API Platform Modernization", "StageName": "Proposal",
+         "Amount": 420000, "CloseDate": "2025-09-30", "IsClosed": False, "SystemModstamp": "2025-06-09T11:20:00.000+0000"},
+        {"Id": "006Dn000000CicdIAS", "AccountId": "001Dn000001FsrvIAC", "Name": "CI/CD Managed Services", "StageName": "Closed Won",
+         "Amount": 150000, "CloseDate": "2024-12-15", "IsClosed": True, "SystemModstamp": "2024-12-16T09:00:00.000+0000"},
+        {"Id": "006Dn000000TafpIAS", "AccountId": "001Dn000001HndaIAC", "Name": "Test Automation Framework Pilot", "StageName": "Qualification",
+         "Amount": 80000, "CloseDate": "2025-11-01", "IsClosed": False, "SystemModstamp": "2025-05-30T15:10:00.000+0000"},
+    ],
+}
+
+
+def _load_data() -> dict:
+    path = os.getenv("SALESFORCE_STUB_DATA")
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_DATA
+
+DATA = _load_data()
+
+# Parent-to-child relationship names used in SOQL subqueries
+CHILD_RELATIONSHIPS = {"Contacts": "Contact", "Opportunities": "Opportunity"}
+
+_SUBQUERY = re.compile(
+    r"^\(\s*SELECT\s+(?P<fields>.+?)\s+FROM\s+(?P<rel>\w+)"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+ORDER BY\s+(?P<order>\w+)(?:\s+(?P<dir>ASC|DESC))?)?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?\s*\)$", re.I)
+
+_CONDITION = re.compile(
+    r"(\w+)\s*(=|!=|LIKE|IN)\s*('(?:[^']*)'|\((?:[^)]*)\)|true|false|\d+(?:\.\d+)?)", re.I)
+
+
+def _matches(record: dict, where: str) -> bool:
+    """Evaluates a flat, AND-only subset of SOQL: =, !=, LIKE and IN."""
+    for field, op, raw in _CONDITION.findall(where or ""):
+        value = record.get(field)
+        op = op.upper()
+        if op == "IN":
+            options = [v.strip().strip("'") for v in raw.strip("()").split(",")]
+            if str(value) not in options:
+                return False
+            continue
+        if raw.lower() in ("true", "false"):
+            expected = raw.lower() == "true"
+        else:
+            expected = raw.strip("'")
+        if op == "LIKE":
+            literal = str(expected).replace("\\%", "\x00").replace("\\_", "\x01")
+            pattern = re.escape(literal).replace("%", ".*").replace("_", ".")
+            pattern = "^" + pattern.replace("\x00", "%").replace("\x01", "_") + "$"
+            if not re.match(pattern, str(value or ""), re.I):
+                return False
+        elif op == "=" and value != expected and str(value) != str(expected):
+            return False
+        elif op == "!=" and (value == expected or str(value) == str(expected)):
+            return False
+    return True
+
+
+def _project(record: dict, fields: list) -> dict:
+    """Copies the requested fields, expanding '(SELECT ... FROM Contacts ...)' subqueries."""
+    out = {}
+    for field in fields:
+        sub = _SUBQUERY.match(field.strip())
+        if not sub:
+            out[field] = record.get(field)
+            continue
+        child_object = CHILD_RELATIONSHIPS.get(sub.group("rel"), sub.group("rel"))
+        children = [c for c in DATA.get(child_object, [])
+                    if c.get("AccountId") == record.get("Id") and _matches(c, sub.group("where"))]
+        if sub.group("order"):
+            children.sort(key=lambda c: str(c.get(sub.group("order")) or ""),
+                          reverse=(sub.group("dir") or "").upper() == "DESC")
+        if sub.group("limit"):
+            children = children[:int(sub.group("limit"))]
+        child_fields = [f.strip() for f in sub.group("fields").split(",")]
+        out[sub.group("rel")] = {"totalSize": len(children), "records": [_project(c, child_fields) for c in children]}
+    return out
+
+
+@mcp.tool()
+def salesforce_search_objects(searchPattern: str) -> str:
+    """Search for standard and custom objects by name pattern."""
+    names = [name for name in DATA if searchPattern.lower() in name.lower()]
+    return json.dumps(names)
+
+@mcp.tool()
+def salesforce_query_records(objectName: str, fields: list[str], whereClause: str = "", orderBy: str = "", limit: int = 0) -> str:
+    """Query records with a SOQL-style where clause."""
+    rows = [r for r in DATA.get(objectName, []) if _matches(r, whereClause)]
+    if limit:
+        rows = rows[:limit]
+    projected = [_project(r, fields) for r in rows]
+    return json.dumps({"totalSize": len(projected), "records": projected})
+
+@mcp.tool()
+def salesforce_search_all(searchTerm: str, objects: list[dict]) -> str:
+    """SOSL-style search across several objects at once."""
+    term = searchTerm.strip("*% ").lower()
+    results = {}
+    for spec in objects:
+        name = spec.get("name")
+        fields = spec.get("fields") or ["Id", "Name"]
+        rows = [r for r in DATA.get(name, []) if term in str(r.get("Name", "")).lower()]
+        if spec.get("where"):
+            rows = [r for r in rows if _matches(r, spec["where"])]
+        if spec.get("limit"):
+            rows = rows[:spec["limit"]]
+        results[name] = [{f: r.get(f) for f in fields} for r in rows]
+    return json.dumps(results)
+
+
+if __name__ == "__main__":
+    mcp.run()
@@ -0,0 +1,180 @@
+#token_usage.py
+"""
+LLM token accounting. Every crew kickoff and direct LLM call records its prompt
+and completion tokens against the current conversation and step (set per chat
+turn with usage_scope), aggregated per day in SQLite. Providers that don't
+report usage are estimated at ~4 characters per token and flagged as estimated.
+
+LLM_PROMPT_TOKEN_BUDGET caps a single prompt; LLM_BUDGET_MODE decides whether an
+oversized prompt is truncated (the middle is cut, keeping the head and the
+question at the end) or rejected with PromptBudgetExceeded.
+"""
+import os
+import math
+import sqlite3
+import contextvars
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from crewai.agents.agent_builder.utilities.base_token_process import TokenProcess
+from crewai.utilities.token_counter_callback import TokenCalcHandler
+from metrics import inc, describe
+from storage import connect, apply_migrations, DB_PATH
+
+LLM_USAGE_DB = os.getenv("LLM_USAGE_DB", DB_PATH)
+LLM_USAGE_ENABLED = os.getenv("LLM_USAGE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "0"))  # 0 = no limit
+LLM_BUDGET_MODE = os.getenv("LLM_BUDGET_MODE", "truncate").lower()      # "truncate" or "fail"
+CHARS_PER_TOKEN = 4
+
+_scope = contextvars.ContextVar("usage_scope", default=("-", "-"))
+
+
+class PromptBudgetExceeded(ValueError):
+    pass
+
+
+LLM_USAGE_MIGRATIONS = [
+    """
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            day TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            step TEXT NOT NULL,
+            agent TEXT NOT NULL,
+            calls INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            estimated_calls INTEGER NOT NULL DEFAULT 0,
+            last_call TIMESTAMP,
+            PRIMARY KEY (day, session_id, step, agent)
+        )
+    """,
+]
+
+def init_usage_db():
+    apply_migrations("llm_usage", LLM_USAGE_MIGRATIONS, LLM_USAGE_DB)
+
+
+@contextmanager
+def usage_scope(session_id: str, step: str):
+    """Attributes LLM calls made inside the block to this conversation and step."""
+    token = _scope.set((session_id or "-", step or "-"))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+def apply_budget(prompt: str, agent: str = "") -> str:
+    """Returns the prompt unchanged, truncated to the budget, or raises PromptBudgetExceeded."""
+    tokens = estimate_tokens(prompt)
+    if not LLM_PROMPT_TOKEN_BUDGET or tokens <= LLM_PROMPT_TOKEN_BUDGET:
+        return prompt
+    if LLM_BUDGET_MODE == "fail":
+        inc("lsha_llm_prompt_budget_exceeded_total", agent=agent, action="rejected")
+        raise PromptBudgetExceeded(
+            f"Prompt for '{agent}' is ~{tokens} tokens, over the {LLM_PROMPT_TOKEN_BUDGET} token budget.")
+    keep = LLM_PROMPT_TOKEN_BUDGET * CHARS_PER_TOKEN
+    marker = f"\n[... {tokens - LLM_PROMPT_TOKEN_BUDGET} tokens truncated ...]\n"
+    if keep <= len(marker):
+        inc("lsha_llm_prompt_budget_exceeded_total", agent=agent, action="rejected")
+        raise PromptBudgetExceeded(
+            f"LLM_PROMPT_TOKEN_BUDGET={LLM_PROMPT_TOKEN_BUDGET} is too small to truncate the '{agent}' prompt "
+            f"(~{tokens} tokens) into.")
+    inc("lsha_llm_prompt_budget_exceeded_total", agent=agent, action="truncated")
+    print(f"[WARN] Prompt for '{agent}' is ~{tokens} tokens; truncating to {LLM_PROMPT_TOKEN_BUDGET}.")
+    # Keep the head and the last quarter (where the question is), shrinking the tail if the marker needs the room
+    room = keep - len(marker)
+    tail = min(keep // 4, room)
+    head = room - tail
+    return prompt[:head] + marker + (prompt[-tail:] if tail else "")
+
+
+def record_usage(agent: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+    session_id, step = _scope.get()
+    inc("lsha_llm_tokens_total", prompt_tokens, agent=agent, kind="prompt")
+    inc("lsha_llm_tokens_total", completion_tokens, agent=agent, kind="completion")
+    if not LLM_USAGE_ENABLED:
+        return
+    try:
+        with connect(LLM_USAGE_DB) as conn:
+            conn.execute("""
+                INSERT INTO llm_usage (day, session_id, step, agent, calls, prompt_tokens, completion_tokens, estimated_calls, last_call)
+                VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT (day, session_id, step, agent) DO UPDATE SET
+                    calls = calls + 1,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    estimated_calls = estimated_calls + excluded.estimated_calls,
+                    last_call = excluded.last_call
+            """, (date.today().isoformat(), session_id, step, agent,
+                  prompt_tokens, completion_tokens, int(estimated), datetime.now()))
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"[WARN] Could not record LLM usage: {e}")
+
+
+def tracked_kickoff(crew, agent: str, prompt: str = "", inputs: dict = None):
+    """
+    Runs crew.kickoff() and records the tokens it used. CrewAI's token_usage is
+    cumulative for the crew's agents, so a reused crew records the difference.
+    """
+    before = crew.calculate_usage_metrics()
+    output = crew.kickoff(inputs=inputs) if inputs is not None else crew.kickoff()
+    after = output.token_usage
+    requests = after.successful_requests - before.successful_requests
+    if requests > 0:
+        record_usage(agent, after.prompt_tokens - before.prompt_tokens,
+                     after.completion_tokens - before.completion_tokens)
+    else:
+        record_usage(agent, estimate_tokens(prompt), estimate_tokens(getattr(output, "raw", "") or ""), estimated=True)
+    return output
+
+def tracked_call(llm, messages: list, agent: str) -> str:
+    """One llm.call() with token usage captured from the provider response (or estimated)."""
+    process = TokenProcess()
+    response = str(llm.call(messages, callbacks=[TokenCalcHandler(process)]))
+    if process.successful_requests:
+        record_usage(agent, process.prompt_tokens, process.completion_tokens)
+    else:
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        record_usage(agent, estimate_tokens(prompt), estimate_tokens(response), estimated=True)
+    return response
+
+
+def usage_report(days: int = 7, session_id: str = None) -> dict:
+    """Token totals for the last `days` days, per day, per step and per conversation."""
+    since = (date.today() - timedelta(days=max(0, days - 1))).isoformat()
+    where, params = "WHERE day >= ?", [since]
+    if session_id:
+        where += " AND session_id = ?"
+        params.append(session_id)
+    columns = "SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(estimated_calls)"
+
+    def rows(group_by: str, limit: int = 0):
+        sql = f"SELECT {group_by}, {columns} FROM llm_usage {where} GROUP BY {group_by} ORDER BY SUM(prompt_tokens) DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with connect(LLM_USAGE_DB) as conn:
+            result = conn.execute(sql, params).fetchall()
+        width = len(group_by.split(","))
+        return [
+            dict(zip([c.strip() for c in group_by.split(",")], r[:width]),
+                 calls=r[width], prompt_tokens=r[width + 1], completion_tokens=r[width + 2],
+                 estimated_calls=r[width + 3])
+            for r in result
+        ]
+
+    return {
+        "since": since,
+        "prompt_token_budget": LLM_PROMPT_TOKEN_BUDGET or None,
+        "budget_mode": LLM_BUDGET_MODE,
+        "per_day": sorted(rows("day"), key=lambda r: r["day"]),
+        "per_step": rows("step, agent"),
+        "per_session": rows("session_id", limit=50),
+    }
+
+
+describe("lsha_llm_tokens_total", "LLM tokens by agent and kind (prompt/completion), including estimates.")
+describe("lsha_llm_prompt_budget_exceeded_total", "Prompts over LLM_PROMPT_TOKEN_BUDGET, truncated or rejected.")